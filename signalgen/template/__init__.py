@@ -1,4 +1,12 @@
 from signalgen.template.parser import *
 from signalgen.template.parser_v1 import *
 from signalgen.template.utils import *
+from signalgen.template.ir import *
+from signalgen.template.output import *
+from signalgen.template.terms import *
 from signalgen.template.stats import *
+from signalgen.template.geocode import *
+from signalgen.template.metrics import *
+from signalgen.template.world import *
+from signalgen.template.worldcache import *
+from signalgen.template.sampling import *
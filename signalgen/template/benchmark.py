@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import gzip
+import shutil
+import platform
+import datetime
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.server
+import numpy as np
+import schema_grapher
+
+from signalgen.template import *
+
+BENCH_VERSION = 1
+BENCH_LAT = 46.2
+BENCH_LON = -119.1
+BENCH_DATE = 1600000000
+#[attribute, schema class, range, kind of value in the world graph]
+BENCH_ATTRIBUTES = [
+    ['eventName', 'Event', 'Text', 'text'],
+    ['eventDescription', 'Event', 'Text', 'text'],
+    ['eventCount', 'Event', 'Integer', 'int'],
+    ['eventScore', 'Event', 'Number', 'float'],
+    ['startDate', 'Event', 'Date', 'date'],
+    ['eventGeo', 'Event', 'GeoShape', 'geo'],
+    ['relatedEvent', 'Event', 'Event', 'object'],
+    ['personIdentifierSurName', 'PersonIdentifier', 'Text', 'text'],
+    ['personIdentifierGivenName', 'PersonIdentifier', 'Text', 'text'],
+    ['locationCity', 'AddressLocation', 'Text', 'text'],
+    ['locationStreet', 'AddressLocation', 'Text', 'text'],
+    ['locationGeoPoint', 'AddressLocation', 'GeoShape', 'geo'],
+]
+BENCH_GEO_DISTANCES = [500, 5000, 100000]
+
+def Vocabulary(size, rng):
+    """Function to make a list of distinct pronounceable words"""
+    consonants = list('bcdfghjklmnprstvwz')
+    vowels = list('aeiou')
+    words = {}
+    while len(words) < size:
+        n = int(rng.integers(2, 5))
+        words[''.join([consonants[rng.integers(len(consonants))] + vowels[rng.integers(len(vowels))] for i in range(n)])] = None
+    return list(words.keys())
+
+def ZipfChoice(values, size, rng, a=1.3):
+    """Function to draw values with a long tailed frequency distribution where the first values are the most common"""
+    picks = np.minimum(rng.zipf(a, size) - 1, len(values) - 1)
+    return [values[i] for i in picks]
+
+def WriteSyntheticSchema(fpath):
+    """Function to write a JSON-LD schema declaring the benchmark classes and attributes"""
+    graph = [{'@id': baseURI + i, '@type': 'rdfs:Class'} for i in dict.fromkeys([j[1] for j in BENCH_ATTRIBUTES])]
+    graph += [{'@id': baseURI + i[0], '@type': 'rdf:Property', baseURI + 'domainIncludes': {'@id': baseURI + i[1]}, baseURI + 'rangeIncludes': {'@id': baseURI + i[2]}} for i in BENCH_ATTRIBUTES]
+    with open(fpath, 'w') as f:
+        json.dump({'@context': {'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#', 'rdfs': 'http://www.w3.org/2000/01/rdf-schema#'}, '@graph': graph}, f, indent=1)
+    return fpath
+
+def WriteSyntheticWorld(wrldir, triples=100000, seed=0, files=4, compress=False, vocabulary=2000):
+    """Function to write a world graph of n-triples files with long tailed text values, log-normal counts, normal scores and dates spread over two decades, returns the words used so templates can refer to them"""
+    rng = np.random.default_rng(seed)
+    words = Vocabulary(vocabulary, rng)
+    if not os.path.exists(wrldir):
+        os.makedirs(wrldir)
+    literal = [i for i in BENCH_ATTRIBUTES if i[3] in ['text', 'int', 'float', 'date']]
+    attrs = [literal[i] for i in rng.integers(0, len(literal), triples)]
+    first = ZipfChoice(words, triples, rng)
+    second = ZipfChoice(words, triples, rng, 1.1)
+    ints = np.round(rng.lognormal(3, 1, triples)).astype(np.int64)
+    floats = rng.normal(50, 15, triples)
+    days = rng.integers(0, 20*365, triples)
+    start = datetime.date(2000, 1, 1)
+    per_file = int(np.ceil(triples / files))
+    for k in range(files):
+        fpath = os.path.join(wrldir, 'world' + str(k) + ('.nt.gz' if compress else '.nt'))
+        with (gzip.open(fpath, 'wt', encoding='utf-8') if compress else open(fpath, 'w', encoding='utf-8')) as f:
+            for j in range(k * per_file, min(triples, (k + 1) * per_file)):
+                attr = attrs[j]
+                if attr[3] == 'text':
+                    obj = '"' + first[j] + ' ' + second[j] + '"'
+                elif attr[3] == 'int':
+                    obj = '"' + str(ints[j]) + '"^^<http://www.w3.org/2001/XMLSchema#integer>'
+                elif attr[3] == 'float':
+                    obj = '"' + str(round(float(floats[j]), 3)) + '"^^<http://www.w3.org/2001/XMLSchema#double>'
+                else:
+                    obj = '"' + (start + datetime.timedelta(days=int(days[j]))).isoformat() + '"^^<http://www.w3.org/2001/XMLSchema#date>'
+                f.write('<' + baseURI + 'w' + str(j // 4) + '> <' + baseURI + attr[0] + '> ' + obj + ' .\n')
+    return words
+
+def SyntheticGazetteer(lat, lon, size=10000, seed=0, distance=50000):
+    """Function to make gazetteer entries scattered around a point so address fakes can be geocoded offline"""
+    rng = np.random.default_rng(seed)
+    words = Vocabulary(200, rng)
+    lats, lons = RandLatLonBatch(lat, lon, distance, size, rng)
+    cities = ZipfChoice([i.capitalize() for i in words[:20]], size, rng)
+    streets = ZipfChoice([i.capitalize() + ' St' for i in words[20:]], size, rng)
+    return [AddressFeature(lats[i], lons[i], {'house_number': str(int(rng.integers(1, 9999))), 'road': streets[i], 'city': cities[i], 'state': 'WA', 'country': 'US'}) for i in range(size)]
+
+def AttributeConstraint(rng, words):
+    """Function to draw one V0 attribute constraint on an Event"""
+    kind = int(rng.integers(5))
+    if kind == 0:
+        return {'schemaAttribute': 'eventName', 'attributeConstraintType': 'ANY', 'value': ''}
+    if kind == 1:
+        return {'schemaAttribute': 'eventDescription', 'attributeConstraintType': 'STRING_CONTAINS', 'value': words[int(rng.integers(min(50, len(words))))]}
+    if kind == 2:
+        return {'schemaAttribute': 'eventCount', 'attributeConstraintType': 'LESS_THAN', 'value': str(int(rng.integers(5, 100)))}
+    if kind == 3:
+        return {'schemaAttribute': 'eventScore', 'attributeConstraintType': 'GREATER_THAN_OR_EQUAL', 'value': str(int(rng.integers(20, 80)))}
+    return {'schemaAttribute': 'eventName', 'attributeConstraintType': 'EQUALS', 'value': words[int(rng.integers(len(words)))]}
+
+def SyntheticV0(things=100, relationships=1.0, equality=0.5, difference=0.5, geo=0.5, attributes=3, seed=0, words=None):
+    """Function to make a V0 template of Event things, relationships, equality and difference constraints are given per thing, difference and GEO_DISTANCE constraints form trees so they can always be satisfied"""
+    rng = np.random.default_rng(seed)
+    words = Vocabulary(100, rng) if words == None else words
+    template = {'id': 'bench-v0-' + str(things), 'thingSpecs': [], 'relationshipSpecs': [], 'comparisonConstraints': []}
+    for i in range(things):
+        template['thingSpecs'] += [{'id': 't' + str(i), 'schemaClass': 'Event', 'attributeConstraints': [AttributeConstraint(rng, words) for j in range(attributes)]}]
+    for i in range(int(relationships * things)):
+        a, b = rng.choice(things, 2, replace=False)
+        template['relationshipSpecs'] += [{'node1': 't' + str(a), 'node2': 't' + str(b), 'edge': 'relatedEvent'}]
+    for i in range(int(equality * things)):
+        a, b = rng.choice(things, 2, replace=False)
+        template['comparisonConstraints'] += [{'thing1': 't' + str(a), 'thing2': 't' + str(b), 'schemaAttribute1': 'eventName', 'schemaAttribute2': 'eventName', 'constraint': {'predicate': 'EQUALS'}}]
+    for i in range(min(things - 1, int(difference * things))):
+        a = i + 1
+        b = int(rng.integers(a))
+        low = int(rng.integers(-5, 5))
+        template['comparisonConstraints'] += [{'thing1': 't' + str(a), 'thing2': 't' + str(b), 'schemaAttribute1': 'startDate', 'schemaAttribute2': 'startDate', 'constraint': {'differenceConstraint': 'true', 'minValue': low, 'maxValue': low + int(rng.integers(0, 10))}}]
+    for i in range(min(things - 1, int(geo * things))):
+        a = i + 1
+        b = int(rng.integers(a))
+        template['comparisonConstraints'] += [{'thing1': 't' + str(a), 'thing2': 't' + str(b), 'schemaAttribute1': 'eventGeo', 'schemaAttribute2': 'eventGeo', 'constraint': {'norm': 'GEO_DISTANCE', 'maxValue': BENCH_GEO_DISTANCES[int(rng.integers(len(BENCH_GEO_DISTANCES)))]}}]
+    return template
+
+def SyntheticComponent(cid, paths, rng, words):
+    """Function to make a V1 component whose root Event has data type property constraints and whose paths hold an address, a person and related events"""
+    def Constraints():
+        return [{'any': ['eventName', '']}, {'lessThan': ['eventCount', str(int(rng.integers(5, 100)))]}, {'and': [{'stringLike': ['eventDescription', words[int(rng.integers(min(50, len(words))))]]}]}, {'greaterThanOrEquals': ['eventScore', str(int(rng.integers(20, 80)))]}]
+    paths = [{'pathFromRoot': 'location', 'dataSchemaClass': 'AddressLocation', 'dataTypePropertyConstraints': []}, {'pathFromRoot': 'participant', 'dataSchemaClass': 'PersonIdentifier', 'dataTypePropertyConstraints': []}] + [{'pathFromRoot': 'related' + str(i), 'dataSchemaClass': 'Event', 'dataTypePropertyConstraints': Constraints()} for i in range(paths)]
+    return {'id': cid, 'hydratedThingSpec': {'rootThing': {'dataSchemaClass': 'Event', 'dataTypePropertyConstraints': Constraints()}, 'thingPropertyConstraints': paths}}
+
+def SyntheticV1(components=20, kinds=4, paths=2, equality=0.5, difference=0.5, geo=0.5, seed=0, words=None):
+    """Function to make a V1 template of components drawn from a few component specs and the specs themselves, constraint densities are given per component and difference and geoNear constraints form trees"""
+    rng = np.random.default_rng(seed)
+    words = Vocabulary(100, rng) if words == None else words
+    specs = {'bench-c' + str(i): SyntheticComponent('bench-c' + str(i), paths, rng, words) for i in range(kinds)}
+    template = {'id': 'bench-v1-' + str(components), 'templateComponents': [{'id': 'bench-c' + str(int(rng.integers(kinds))), 'alias': 'C' + str(i)} for i in range(components)], 'templateComponentComparisonConstraints': []}
+    for i in range(int(equality * components)):
+        a, b = rng.choice(components, 2, replace=False)
+        template['templateComponentComparisonConstraints'] += [{'equals': ['C' + str(a) + '.root.eventName', 'C' + str(b) + '.root.eventName']}]
+    for i in range(min(components - 1, int(difference * components))):
+        low = int(rng.integers(0, 5))
+        template['templateComponentComparisonConstraints'] += [{'difference': {'subtrahend': 'C' + str(int(rng.integers(i + 1))) + '.root.startDate', 'minuend': 'C' + str(i + 1) + '.root.startDate', 'minValue': low, 'maxValue': low + int(rng.integers(0, 10))}}]
+    for i in range(min(components - 1, int(geo * components))):
+        template['templateComponentComparisonConstraints'] += [{'geoNear': {'geometries': ['C' + str(int(rng.integers(i + 1))) + '.root.eventGeo', 'C' + str(i + 1) + '.root.eventGeo'], 'distance': BENCH_GEO_DISTANCES[int(rng.integers(len(BENCH_GEO_DISTANCES)))]}}]
+    return template, specs
+
+def Timings(seconds):
+    """Function to summarize repeated wall times"""
+    return {'best': round(min(seconds), 6), 'median': round(statistics.median(seconds), 6), 'mean': round(statistics.mean(seconds), 6), 'runs': len(seconds)}
+
+def Repeat(fn, repeat=3):
+    """Function to time repeated calls of fn, returns the timings and the result of the last call"""
+    seconds = []
+    result = None
+    for i in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = fn()
+        seconds += [time.perf_counter() - start]
+    return Timings(seconds), result
+
+def BenchReadWorld(wrldir, repeat=3, num_threads=1):
+    """Function to time counting the world graph with AttributeGen"""
+    timings, agen = Repeat(lambda: AttributeGen(wrldir, num_threads=num_threads), repeat)
+    timings['attributes'] = len(agen.attrcounts)
+    timings['values'] = sum([len(v) for v in agen.attrcounts.values()])
+    return timings, agen
+
+def BenchAttributes(agen, draws=2000, seed=0, words=None):
+    """Function to time AttributeGen.GenerateAttribute for each kind of constraint, the first call of each builds its index and is timed apart"""
+    rng = np.random.default_rng(seed)
+    words = ['a'] if words == None else words
+    cases = {
+        'ANY': ['eventName', 'ANY', ''],
+        'STRING_CONTAINS': ['eventDescription', 'STRING_CONTAINS', words[0]],
+        'LESS_THAN': ['eventCount', 'LESS_THAN', '20'],
+        'GREATER_THAN_OR_EQUAL': ['eventScore', 'GREATER_THAN_OR_EQUAL', '60'],
+        'EQUALS': ['eventName', 'EQUALS', words[0]],
+    }
+    results = {}
+    for k,v in cases.items():
+        start = time.perf_counter()
+        agen.GenerateAttribute(v[0], v[1], v[2], 0.5, rng)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(draws):
+            agen.GenerateAttribute(v[0], v[1], v[2], float(i % 10) / 10, rng)
+        results[k] = {'first': round(first, 6), 'per_call': round((time.perf_counter() - start) / draws, 9), 'draws': draws}
+    return results
+
+def BenchParser(base, outdir, signals=10, shards=False):
+    """Function to generate signals from a prepared parser and write them out to a cleared output directory, returns the wall time and the summed stage metrics of the signals"""
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.makedirs(outdir)
+    metrics = Metrics()
+    start = time.perf_counter()
+    writer = ShardedWriter(outdir, 'bench') if shards else None
+    for seed in range(signals):
+        instance = base.Instance(seed, [0.1, 0.5, 0.9][seed % 3]).Generate(False)
+        if writer != None:
+            instance.WriteSignal(writer, str(seed))
+        else:
+            instance.StreamTriples(os.path.join(outdir, str(seed) + '.nt'))
+        metrics.Merge(instance.metrics.Report())
+    if writer != None:
+        writer.Close()
+    seconds = time.perf_counter() - start
+    report = metrics.Report()
+    report.update({'seconds': round(seconds, 6), 'signals': signals, 'signals_per_second': round(signals / seconds, 3), 'triples_per_second': round(report['counters'].get('triples', 0) / seconds, 3)})
+    return report
+
+class StatsStandIn:
+    """Class that serves the propertyCounts route of the stats endpoint from attribute counts on a local port, so the stats client can be measured without a network"""
+    def __init__(self, attrcounts, latency=0.0):
+        self.attrcounts = attrcounts
+        self.latency = latency
+        self.requests = 0
+        self.server = None
+        self.thread = None
+
+    def Handler(self):
+        """Function that returns the request handler class bound to this stand-in"""
+        standin = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                standin.requests += 1
+                time.sleep(standin.latency)
+                buckets = []
+                for i in body['nodeProperties']:
+                    counts = standin.attrcounts.get(i['propertyName'], {})
+                    buckets += [{'propertyName': i['propertyName'], 'buckets': [{'key': k if type(k) in [str, int, float, bool] else str(k), 'doc_count': v} for k,v in sorted(counts.items(), key=lambda x: -x[1])[:1000]]}]
+                data = json.dumps({'propertyBuckets': buckets}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def log_message(self, *args):
+                return
+        return Handler
+
+    def Start(self):
+        """Function to start serving on a free local port, returns the base url of the stand-in"""
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self.Handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/'
+
+    def Stop(self):
+        """Function to stop serving"""
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        return self
+
+def BenchStats(attrcounts, schema, cachedir, latency=0.01, batchsize=STATS_BATCH_SIZE):
+    """Function to time fetching every schema attribute's counts through the stats client from a local stand-in, first from the stand-in and then from the disk cache"""
+    standin = StatsStandIn(attrcounts, latency)
+    qapi = standin.Start()
+    try:
+        if os.path.exists(cachedir):
+            shutil.rmtree(cachedir)
+        props = [i[0] for i in BENCH_ATTRIBUTES]
+        start = time.perf_counter()
+        stats = Stats(schema, qapi, cachedir=cachedir, batchsize=batchsize)
+        AttributeGen('', attrcounts=stats).Prefetch(props)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        cached = Stats(schema, qapi, cachedir=cachedir, batchsize=batchsize)
+        AttributeGen('', attrcounts=cached).Prefetch(props)
+        warm = time.perf_counter() - start
+    finally:
+        standin.Stop()
+    return {'cold': round(cold, 6), 'warm': round(warm, 6), 'requests': standin.requests, 'properties': len(props), 'latency': latency}
+
+def Environment():
+    """Function to describe the machine and code a benchmark ran on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {'python': sys.version.split()[0], 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': commit}
+
+def RunBenchmarks(workdir=None, seed=0, world_triples=100000, world_files=4, things=100, components=20, signals=10, draws=2000, repeat=3, num_threads=1, stats_latency=0.01):
+    """Function to build the synthetic schema, world graph, gazetteer and templates in a work directory and run every benchmark offline, returns the results as a dictionary whose 'results' map metric names to seconds"""
+    cleanup = workdir == None
+    workdir = tempfile.mkdtemp(prefix='signalgen-bench-') if workdir == None else workdir
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    params = {'seed': seed, 'world_triples': world_triples, 'world_files': world_files, 'things': things, 'components': components, 'signals': signals, 'draws': draws, 'repeat': repeat, 'num_threads': num_threads, 'stats_latency': stats_latency}
+    try:
+        schema = WriteSyntheticSchema(os.path.join(workdir, 'schema.jsonld'))
+        pt = schema_grapher.util.rdf.PropertyType(schema)
+        words = WriteSyntheticWorld(os.path.join(workdir, 'world'), world_triples, seed, world_files)
+        geocoder = CachedGeocoder(GazetteerGeocoder(SyntheticGazetteer(BENCH_LAT, BENCH_LON, 10000, seed)))
+        details = {}
+        results = {}
+
+        details['ReadWorld'], agen = BenchReadWorld(os.path.join(workdir, 'world'), repeat, num_threads)
+        results['ReadWorld'] = details['ReadWorld']['median']
+
+        details['GenerateAttribute'] = BenchAttributes(agen, draws, seed, words)
+        for k,v in details['GenerateAttribute'].items():
+            results['GenerateAttribute.' + k] = v['per_call']
+
+        v0 = SyntheticV0(things, seed=seed, words=words)
+        base = TemplateParser(v0, pt, BENCH_LAT, BENCH_LON, 0, BENCH_DATE, 0.5, agen.GenerateAttribute).Prepare()
+        details['V0'] = BenchParser(base, os.path.join(workdir, 'out-v0'), signals)
+        v1, specs = SyntheticV1(components, seed=seed, words=words)
+        cdir = os.path.join(workdir, 'components')
+        if not os.path.exists(cdir):
+            os.makedirs(cdir)
+        for k,v in specs.items():
+            with open(os.path.join(cdir, k + '.json'), 'w') as f:
+                json.dump(v, f)
+        base = TemplateParserV1(v1, [cdir], pt, BENCH_LAT, BENCH_LON, 0, BENCH_DATE, 0.5, agen.GenerateAttribute, geocoder=geocoder).Prepare()
+        details['V1'] = BenchParser(base, os.path.join(workdir, 'out-v1'), signals, shards=True)
+        for version in ['V0', 'V1']:
+            results[version + '.seconds_per_signal'] = round(details[version]['seconds'] / signals, 6)
+            for k,v in details[version]['stages'].items():
+                results[version + '.' + k] = round(v['seconds'] / signals, 6)
+
+        details['Stats'] = BenchStats(agen.attrcounts, schema, os.path.join(workdir, 'stats-cache'), stats_latency)
+        results['Stats.cold'] = details['Stats']['cold']
+        results['Stats.warm'] = details['Stats']['warm']
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {'benchmark': 'signalgen', 'version': BENCH_VERSION, 'created': datetime.datetime.now(datetime.timezone.utc).isoformat(), 'environment': Environment(), 'params': params, 'results': results, 'details': details}
+
+def CompareResults(baseline, current, threshold=0.2, floor=1e-5):
+    """Function to compare the metrics of two benchmark results, returns [metric, baseline, current, ratio] for every metric that is more than threshold slower, metrics missing from either result or below floor seconds in both are skipped as noise"""
+    regressions = []
+    for k,v in current['results'].items():
+        if k in baseline['results'].keys() and baseline['results'][k] > 0 and max(v, baseline['results'][k]) >= floor:
+            ratio = v / baseline['results'][k]
+            if ratio > 1 + threshold:
+                regressions += [[k, baseline['results'][k], v, round(ratio, 3)]]
+    return regressions
@@ -0,0 +1,168 @@
+import csv
+import json
+import gzip
+import math
+import threading
+import schema_grapher
+import numpy as np
+from collections import OrderedDict
+
+GEOCODE_CACHE_SIZE = 65536
+GEOCODE_PRECISION = 4
+ADDRESS_FIELDS = ['house_number', 'road', 'city', 'county', 'state', 'postcode', 'country']
+NOT_FOUND = {'properties': {'error': 'Unable to geocode'}}
+
+def UnitVectors(lats, lons):
+    """Function to convert latitudes and longitudes to points on the unit sphere, the straight line distance between them orders points the same way as the great circle distance"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)], axis=-1)
+
+def AddressFeature(lat, lon, properties):
+    """Function that returns a gazetteer entry in the shape of a nominatim reverse lookup feature"""
+    properties = dict(properties)
+    if 'address' not in properties.keys():
+        properties['address'] = {k: properties.pop(k) for k in ADDRESS_FIELDS if k in properties.keys() and properties[k] not in [None, '']}
+    if 'display_name' not in properties.keys():
+        properties['display_name'] = ', '.join([str(properties['address'][k]) for k in ADDRESS_FIELDS if k in properties['address'].keys()])
+    return {'type': 'Feature', 'properties': properties, 'geometry': {'type': 'Point', 'coordinates': [float(lon), float(lat)]}}
+
+def ReadGazetteer(fpath):
+    """Function to read a gazetteer file into a list of address features, csv and tsv files need lat and lon columns and may have display_name and address columns, json files hold a GeoJSON feature collection or a list of features and jsonl files one feature per line"""
+    opener = gzip.open if fpath.endswith('.gz') else open
+    name = fpath[:-3] if fpath.endswith('.gz') else fpath
+    features = []
+    with opener(fpath, 'rt', encoding='utf-8') as f:
+        if name.endswith('.csv') or name.endswith('.tsv'):
+            for row in csv.DictReader(f, delimiter='\t' if name.endswith('.tsv') else ','):
+                lat = row.pop('lat') if 'lat' in row.keys() else row.pop('latitude')
+                lon = row.pop('lon') if 'lon' in row.keys() else row.pop('lng') if 'lng' in row.keys() else row.pop('longitude')
+                features += [AddressFeature(lat, lon, {k: v for k,v in row.items() if v not in [None, '']})]
+        else:
+            data = [json.loads(l) for l in f if l.strip() != ''] if name.endswith('.jsonl') else json.load(f)
+            for i in data['features'] if type(data) is dict else data:
+                lon, lat = i['geometry']['coordinates'][:2]
+                features += [AddressFeature(lat, lon, i['properties'] if 'properties' in i.keys() else {})]
+    return features
+
+class LatLonQueryGeocoder:
+    """Geocoder that reverse geocodes with the nominatim service through schema_grapher, one request per lookup"""
+    def Reverse(self, lat, lon):
+        """Function that returns the address feature of a point"""
+        rlookup = schema_grapher.util.LatLonQuery(lat, lon)
+        return rlookup[0]['features'][0]
+
+class GazetteerGeocoder:
+    """Geocoder that answers reverse lookups offline with the nearest entry of a gazetteer, entries are bucketed in a latitude and longitude grid whose columns tile the full circle so a lookup only looks at the cells around the point"""
+    def __init__(self, features, cellsize=None):
+        if type(features) is str:
+            features = ReadGazetteer(features)
+        self.features = features
+        lats = np.array([i['geometry']['coordinates'][1] for i in features], dtype=np.float64)
+        lons = np.array([i['geometry']['coordinates'][0] for i in features], dtype=np.float64)
+        self.xyz = UnitVectors(lats, lons)
+        if cellsize == None:
+            area = (np.ptp(lats) * np.ptp(lons)) if len(features) > 1 else 0.0
+            cellsize = min(1.0, max(0.001, math.sqrt(area / max(1, len(features)))))
+        self.ncols = int(math.ceil(360 / float(cellsize)))
+        self.cellsize = 360 / self.ncols
+        self.nrows = int(math.ceil(180 / self.cellsize)) + 1
+        cells = {}
+        for k, cell in enumerate(zip(*self.Cell(lats, lons))):
+            cells.setdefault(cell, []).append(k)
+        self.cells = {k: np.array(v, dtype=np.int64) for k,v in cells.items()}
+
+    def Cell(self, lat, lon):
+        """Function that returns the grid row and column of points"""
+        return np.floor((np.asarray(lat) + 90) / self.cellsize).astype(np.int64), np.floor((np.asarray(lon) + 180) / self.cellsize).astype(np.int64) % self.ncols
+
+    def Ring(self, i0, j0, k):
+        """Function that returns the entries of the cells k rows or columns away from a cell"""
+        if k == 0:
+            cells = [(i0, j0)]
+        else:
+            cols = dict.fromkeys([(j0 + j) % self.ncols for j in range(-k, k + 1)])
+            cells = [(i, j) for i in [i0 - k, i0 + k] for j in cols] + [(i, (j0 + j) % self.ncols) for i in range(i0 - k + 1, i0 + k) for j in dict.fromkeys([-k, k])]
+        found = [self.cells[i] for i in dict.fromkeys(cells) if i in self.cells]
+        return np.concatenate(found) if len(found) > 0 else []
+
+    def Nearest(self, lat, lon):
+        """Function that returns the position of the gazetteer entry closest to a point, rings of cells are searched outwards until no farther cell can hold a closer entry and every entry is compared once the search has covered more cells than are occupied"""
+        if len(self.features) == 0:
+            return None
+        lat = float(lat)
+        i0, j0 = [int(i) for i in self.Cell(lat, lon)]
+        q = UnitVectors(lat, lon)
+        best = None
+        bestd = None
+        for k in range(max(self.nrows, self.ncols)):
+            if (2 * k + 1) ** 2 > len(self.cells):
+                return int(np.argmin(((self.xyz - q) ** 2).sum(axis=1)))
+            candidates = self.Ring(i0, j0, k)
+            if len(candidates) > 0:
+                d = ((self.xyz[candidates] - q) ** 2).sum(axis=1)
+                m = int(np.argmin(d))
+                if bestd == None or d[m] < bestd:
+                    best = int(candidates[m])
+                    bestd = float(d[m])
+            if best != None:
+                angle = math.degrees(2 * math.asin(min(1.0, math.sqrt(bestd) / 2)))
+                if angle <= k * self.cellsize * math.cos(math.radians(min(90.0, abs(lat) + (k + 1) * self.cellsize))):
+                    break
+        return best
+
+    def Reverse(self, lat, lon):
+        """Function that returns the address feature of the gazetteer entry nearest to a point"""
+        k = self.Nearest(lat, lon)
+        return self.features[k] if k != None else NOT_FOUND
+
+class CachedGeocoder:
+    """Geocoder that memoizes another geocoder's lookups keyed by coordinates rounded to precision decimal places, bounded by evicting the least recently used lookup"""
+    def __init__(self, geocoder, precision=GEOCODE_PRECISION, maxsize=GEOCODE_CACHE_SIZE):
+        self.geocoder = geocoder
+        self.precision = precision
+        self.maxsize = max(1, int(maxsize))
+        self.lookups = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def Reverse(self, lat, lon):
+        """Function that returns the address feature of a point, looking up the rounded point on a miss"""
+        key = (round(float(lat), self.precision), round(float(lon), self.precision))
+        with self.lock:
+            feature = self.lookups.get(key)
+            if feature != None:
+                self.lookups.move_to_end(key)
+                self.hits += 1
+                return feature
+        feature = self.geocoder.Reverse(key[0], key[1])
+        with self.lock:
+            self.misses += 1
+            self.lookups[key] = feature
+            if len(self.lookups) > self.maxsize:
+                self.lookups.popitem(last=False)
+        return feature
+
+    def HitRate(self):
+        """Function that returns the share of lookups answered from the cache"""
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0
+
+    def Stats(self):
+        """Function that returns the cache counters, misses are the lookups passed on to the wrapped geocoder"""
+        return {'size': len(self.lookups), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.HitRate()}
+
+def OpenGeocoder(gazetteer=None, precision=GEOCODE_PRECISION, maxsize=GEOCODE_CACHE_SIZE):
+    """Function that returns a cached geocoder, offline over a gazetteer file when one is given and through the nominatim service otherwise"""
+    return CachedGeocoder(GazetteerGeocoder(gazetteer) if gazetteer != None else LatLonQueryGeocoder(), precision, maxsize)
+
+DEFAULT_GEOCODER = OpenGeocoder()
@@ -0,0 +1,54 @@
+class TemplateIR:
+    """Class that compiles a V0 template into an id to thing map, per thing attribute maps and constraint adjacency lists so lookups do not scan the template, the template stays the source of truth and is what gets written out"""
+    def __init__(self, template):
+        self.template = template
+        self.things = {}
+        self.attributes = []
+        self.adjacency = {}
+        for j,i in enumerate(self.template["thingSpecs"]):
+            if i["id"] not in self.things.keys():
+                self.things[i["id"]] = j
+            attrs = {}
+            if "attributes" in i.keys():
+                for k,v in enumerate(i["attributes"]):
+                    self.IndexAttribute(attrs, k, v)
+            self.attributes += [attrs]
+        if "comparisonConstraints" in self.template.keys():
+            for j,i in enumerate(self.template["comparisonConstraints"]):
+                for k in dict.fromkeys([i["thing1"], i["thing2"]]):
+                    if k not in self.adjacency.keys():
+                        self.adjacency[k] = []
+                    self.adjacency[k] += [j]
+
+    def IndexAttribute(self, attrs, k, v):
+        """Function to record the first and last position of an attribute of a thing"""
+        if v[0] not in attrs.keys():
+            attrs[v[0]] = [k, k]
+        else:
+            attrs[v[0]][1] = k
+
+    def ThingIndex(self, thing):
+        """Function that returns the position of the first thing spec with an id"""
+        return self.things.get(thing)
+
+    def AttrIndex(self, x, attr):
+        """Function that returns the position of the first attribute of the thing at position x with a name"""
+        return self.attributes[x][attr][0] if attr in self.attributes[x].keys() else None
+
+    def AttrValue(self, x, attr):
+        """Function that returns the value of the last attribute of the thing at position x with a name"""
+        return self.template["thingSpecs"][x]["attributes"][self.attributes[x][attr][1]][1] if attr in self.attributes[x].keys() else None
+
+    def AddAttributes(self, x, attrs):
+        """Function that appends attributes to the thing at position x and indexes them"""
+        thing = self.template["thingSpecs"][x]["attributes"]
+        for v in attrs:
+            thing += [v]
+            self.IndexAttribute(self.attributes[x], len(thing) - 1, v)
+        return self
+
+    def Constraints(self, thing=None):
+        """Function that returns the positions of the comparison constraints of a thing in template order, or of every constraint"""
+        if thing == None:
+            return range(len(self.template["comparisonConstraints"])) if "comparisonConstraints" in self.template.keys() else range(0)
+        return self.adjacency[thing] if thing in self.adjacency.keys() else []
@@ -0,0 +1,79 @@
+import json
+import time
+import threading
+
+class StageTimer:
+    """Context manager that adds the wall time of a block to a stage of a Metrics object"""
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.Time(self.stage, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """Class that records the wall time and number of calls of named stages and the totals of named counters, reports are plain dictionaries that can be written as JSON and added up over a run"""
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def Stage(self, stage):
+        """Function that returns a context manager timing a block as a call of a stage"""
+        return StageTimer(self, stage)
+
+    def Time(self, stage, seconds, calls=1):
+        """Function to add wall time and calls to a stage"""
+        with self.lock:
+            if stage not in self.stages.keys():
+                self.stages[stage] = [0.0, 0]
+            self.stages[stage][0] += seconds
+            self.stages[stage][1] += calls
+        return self
+
+    def Count(self, counter, value=1):
+        """Function to add to a counter"""
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+        return self
+
+    def Merge(self, report):
+        """Function to add the stages and counters of a report to these metrics"""
+        for k,v in report['stages'].items() if 'stages' in report.keys() else []:
+            self.Time(k, v['seconds'], v['calls'])
+        for k,v in report['counters'].items() if 'counters' in report.keys() else []:
+            self.Count(k, v)
+        return self
+
+    def Reset(self):
+        """Function to clear the stages and counters"""
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+        return self
+
+    def Report(self):
+        """Function that returns the stages and counters as a dictionary"""
+        with self.lock:
+            return {'stages': {k: {'seconds': round(v[0], 6), 'calls': v[1]} for k,v in self.stages.items()}, 'counters': dict(self.counters)}
+
+def WriteReport(fwrite, report):
+    """Function to write a metrics report to a JSON file"""
+    with open(fwrite, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return report
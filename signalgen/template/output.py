@@ -0,0 +1,157 @@
+import os
+import json
+import gzip
+import urllib.parse
+import schema_grapher
+
+FLUSH_SIZE = 10000
+SHARD_BYTES = 256*1024*1024
+GRAPH_BASE = 'http://schema.localhost/graph/'
+
+def GraphName(source):
+    """Function that returns the graph IRI of a signal from its originSource"""
+    return '<' + GRAPH_BASE + urllib.parse.quote(source, safe='') + '>'
+
+def OpenOutputFile(fwrite, compress=None):
+    """Function to open a text file for writing triples, gzip compressed when compress is set or, if it is None, when the file name ends in .gz"""
+    if compress == None:
+        compress = fwrite.endswith('.gz')
+    if compress:
+        return gzip.open(fwrite, 'wt', encoding='utf-8')
+    return open(fwrite, 'w', encoding='utf-8', buffering=1024*1024)
+
+class TripleWriter:
+    """Class that renders triples and writes them to a file as they are produced, triples are buffered and written every flushsize triples so memory does not grow with the size of the output"""
+    def __init__(self, fwrite, compress=None, flushsize=FLUSH_SIZE):
+        self.fwrite = fwrite
+        self.f = OpenOutputFile(fwrite, compress)
+        self.flushsize = max(1, int(flushsize))
+        self.buffer = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+        return False
+
+    def Write(self, triple):
+        """Function to add a triple to the output"""
+        self.buffer += [triple]
+        self.count += 1
+        if len(self.buffer) >= self.flushsize:
+            self.Flush()
+        return self
+
+    def WriteAll(self, triples):
+        """Function to add every triple of an iterable to the output"""
+        for i in triples:
+            self.Write(i)
+        return self
+
+    def Flush(self):
+        """Function to render the buffered triples and write them to the file"""
+        if len(self.buffer) > 0:
+            rendered = schema_grapher.util.RenderTriples(self.buffer)
+            self.f.write(rendered if rendered.endswith('\n') else rendered + '\n')
+            self.buffer = []
+        return self
+
+    def Close(self):
+        """Function to write the remaining triples and close the file"""
+        if self.f != None:
+            self.Flush()
+            self.f.close()
+            self.f = None
+        return self
+
+class ShardedWriter:
+    """Class that appends the triples of many signals to shard files that are rotated by size or triple count, optionally as N-Quads with each signal's originSource as its graph name or gzip compressed with one member per signal, and writes a manifest line mapping each signal to its shard, byte offset and length, existing shard and manifest files are never overwritten"""
+    def __init__(self, outdir, prefix='signals', quads=False, compress=False, maxbytes=SHARD_BYTES, maxtriples=None, flushsize=FLUSH_SIZE):
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        self.outdir = outdir
+        self.prefix = prefix
+        self.quads = quads
+        self.compress = compress
+        self.maxbytes = maxbytes
+        self.maxtriples = maxtriples
+        self.flushsize = max(1, int(flushsize))
+        self.shard = -1
+        self.f = None
+        self.triples = 0
+        self.manifest = open(os.path.join(outdir, prefix + '.manifest.jsonl'), 'x', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+        return False
+
+    def ShardName(self):
+        """Function that returns the file name of the current shard"""
+        return self.prefix + '-' + str(self.shard).zfill(5) + ('.nq' if self.quads else '.nt') + ('.gz' if self.compress else '')
+
+    def Rotate(self):
+        """Function that closes the current shard and starts the next one"""
+        if self.f != None:
+            self.f.close()
+        self.shard += 1
+        self.triples = 0
+        self.f = open(os.path.join(self.outdir, self.ShardName()), 'xb')
+        return self
+
+    def Full(self):
+        """Function that checks if the current shard has reached its size or triple limit"""
+        if self.f == None:
+            return True
+        if self.maxbytes != None and self.f.tell() >= self.maxbytes:
+            return True
+        return self.maxtriples != None and self.triples >= self.maxtriples
+
+    def Render(self, triples, graph):
+        """Function that renders triples to lines, as quads in the graph when one is given"""
+        if graph != None:
+            return ''.join([' '.join(i) + ' ' + graph + ' .\n' for i in triples])
+        rendered = schema_grapher.util.RenderTriples(triples)
+        return rendered if rendered.endswith('\n') else rendered + '\n'
+
+    def WriteSignal(self, name, source, triples, graphsource=None):
+        """Function that appends the triples of a signal to the current shard, a signal is never split between shards, the graph is named after graphsource when signals share an originSource and after source otherwise"""
+        if self.Full():
+            self.Rotate()
+        graph = GraphName(source if graphsource == None else graphsource) if self.quads else None
+        offset = self.f.tell()
+        out = gzip.GzipFile(fileobj=self.f, mode='wb') if self.compress else self.f
+        count = 0
+        buffer = []
+        for i in triples:
+            buffer += [i]
+            if len(buffer) >= self.flushsize:
+                out.write(self.Render(buffer, graph).encode('utf-8'))
+                count += len(buffer)
+                buffer = []
+        if len(buffer) > 0:
+            out.write(self.Render(buffer, graph).encode('utf-8'))
+            count += len(buffer)
+        if self.compress:
+            out.close()
+        self.f.flush()
+        self.triples += count
+        entry = {'signal': name, 'originSource': source, 'shard': self.ShardName(), 'offset': offset, 'length': self.f.tell() - offset, 'triples': count}
+        if graph != None:
+            entry['graph'] = graph[1:-1]
+        self.manifest.write(json.dumps(entry) + '\n')
+        self.manifest.flush()
+        return entry
+
+    def Close(self):
+        """Function that closes the current shard and the manifest"""
+        if self.f != None:
+            self.f.close()
+            self.f = None
+        if not self.manifest.closed:
+            self.manifest.close()
+        return self
@@ -24,7 +24,8 @@ baseURI = 'http://schema.localhost/'
 class TemplateParser:
     """Class to parse V0 templates and generate signals"""
     TEMPLATE_VERSION = ['V0']
-    def __init__(self, jfile, pt, lat, lon, seed, initdate, difficulty=0.5, attributegen=None):
+    RANDOM_STREAMS = ['attributes', 'ids', 'identities', 'geo', 'diff']
+    def __init__(self, jfile, pt, lat, lon, seed, initdate, difficulty=0.5, attributegen=None, seedseq=None, ids=None):
         jtemp = None
         if type(jfile) is str and os.path.isfile(jfile):
             with open(jfile) as f:
@@ -40,14 +41,104 @@ class TemplateParser:
         self.originSource = self.template["id"] + "|" + str(difficulty) + "|" + str(seed) + "." + str(initdate)
         self.rdf = []
         self.difficulty=difficulty
-        self.AttributeGen = self.GenerateAttribute if attributegen == None else attributegen
+        self.attributefn = self.GenerateAttribute if attributegen == None else attributegen
+        self.attributerng = AcceptsRng(self.attributefn)
+        self.AttributeGen = self.MeteredAttribute
+        self.attributegen = attributegen
         self.subtemplates = []
+        self.snapshot = None
+        self.ir = None
+        self.metrics = Metrics()
+        self.terms = TermCache(pt)
+        self.rngs, self.seedseq = RandomStreams(seed if seedseq == None else seedseq, self.RANDOM_STREAMS)
+        self.ids = ThingIds(self.originSource) if ids == None else ids
+
+    def InlineSubTemplates(self, template):
+        """Function that replaces subtemplate file paths with their parsed contents so they are only read once"""
+        if "optionSubTemplateSpecs" in template.keys():
+            for i in template["optionSubTemplateSpecs"]:
+                if type(i["template"]) is str and os.path.isfile(i["template"]):
+                    with open(i["template"]) as f:
+                        i["template"] = json.load(f)
+                if type(i["template"]) is dict:
+                    self.InlineSubTemplates(i["template"])
+        return template
+
+    def Prepare(self):
+        """Function that does the seed independent work once, reading subtemplates and keeping a serialized snapshot of the template that instances are copied from"""
+        if self.snapshot == None:
+            self.snapshot = json.dumps(self.InlineSubTemplates(self.template))
+        return self
+
+    def Instance(self, seed, difficulty=None):
+        """Function that returns a new parser for a seed and difficulty from the prepared template without reading or parsing it again"""
+        self.Prepare()
+        instance = TemplateParser(json.loads(self.snapshot), self.pt, self.lat, self.lon, seed, self.initdate, self.difficulty if difficulty == None else difficulty, self.attributegen)
+        instance.snapshot = self.snapshot
+        instance.terms = self.terms
+        return instance
+
+    def Generate(self, rdf=True):
+        """Function that runs the seed dependent generation steps of an instance and times each one, the triples are left to StreamTriples when rdf is False"""
+        for stage in ['GenerateSubTemplates', 'ResolveIdentities', 'GenerateThings', 'GenerateRelationships', 'GenerateComparisons'] + (['GenerateRDF'] if rdf else []):
+            with self.metrics.Stage(stage):
+                getattr(self, stage)()
+        return self
+
+    def MeteredAttribute(self, attr, cond, condval, difficulty=0.5, rng=None):
+        """Function that counts a call of the attribute generator and passes it on, with the random generator only when the attribute generator takes one"""
+        self.metrics.Count('attribute_calls')
+        if not self.attributerng:
+            return self.attributefn(attr, cond, condval, difficulty)
+        return self.attributefn(attr, cond, condval, difficulty, rng)
+
+    def Report(self):
+        """Function that returns the stage times and counters of the signal as a dictionary that can be written as JSON"""
+        report = self.metrics.Report()
+        report.update({'template': self.template["id"], 'originSource': self.originSource, 'seed': self.seed, 'difficulty': self.difficulty})
+        return report
+
+    def GenerateInstances(self, instances):
+        """Function that generates a signal for each (seed, difficulty) pair from the prepared template, yields the generated parsers"""
+        self.Prepare()
+        for seed, difficulty in instances:
+            yield self.Instance(seed, difficulty).Generate()
+
+    def Compile(self):
+        """Function that builds the indexed representation of the template used to look up things, attributes and constraints"""
+        self.ir = TemplateIR(self.template)
+        return self
+
+    def PlanAttributes(self, template=None):
+        """Function that lists the schema attributes whose values will be drawn during generation, from the attribute constraints and the equality and difference comparison constraints of the template and its subtemplates"""
+        template = self.InlineSubTemplates(self.template) if template == None else template
+        attrs = []
+        for i in template["thingSpecs"]:
+            if "attributeConstraints" in i.keys():
+                attrs += [j["schemaAttribute"] for j in i["attributeConstraints"] if j["attributeConstraintType"] != "EQUALS"]
+        if "comparisonConstraints" in template.keys():
+            for i in template["comparisonConstraints"]:
+                if ("predicate" in i["constraint"].keys() and i["constraint"]["predicate"] == "EQUALS") or ("differenceConstraint" in i["constraint"].keys() and i["constraint"]["differenceConstraint"] == "true"):
+                    attrs += [i["schemaAttribute1"]]
+        if "optionSubTemplateSpecs" in template.keys():
+            for i in template["optionSubTemplateSpecs"]:
+                if type(i["template"]) is dict:
+                    attrs += self.PlanAttributes(i["template"])
+        return list(dict.fromkeys(attrs))
+
+    def PrefetchAttributes(self, num_threads=PREFETCH_THREADS):
+        """Function that loads the counts of the planned attributes into the attribute generator, when it supports prefetching, before any instance is generated"""
+        agen = getattr(self.attributegen, '__self__', self.attributegen)
+        if hasattr(agen, 'Prefetch'):
+            agen.Prefetch(self.PlanAttributes(), num_threads)
+        return self
 
     def GenerateSubTemplates(self):
-        """Function that instantiates template parsers for each subtemplate"""
+        """Function that instantiates template parsers for each subtemplate, their counters are added to the metrics of this signal"""
         if "optionSubTemplateSpecs" in self.template.keys():
-            for i in self.template["optionSubTemplateSpecs"]:
-                self.subtemplates += [TemplateParser(i["template"], self.lat, self.lon, self.seed, self.initdate+1, self.difficulty, self.AttributeGen).GenerateSubTemplates().ResolveIdentities().GenerateThings().GenerateRelationships().GenerateComparisons()]
+            for k,i in enumerate(self.template["optionSubTemplateSpecs"]):
+                self.subtemplates += [TemplateParser(i["template"], self.pt, self.lat, self.lon, self.seed, self.initdate+1, self.difficulty, self.attributegen, self.seedseq.spawn(1)[0], self.ids.Sub(str(k))).GenerateSubTemplates().ResolveIdentities().GenerateThings().GenerateRelationships().GenerateComparisons()]
+                self.metrics.Merge(self.subtemplates[-1].metrics.Report())
         return self
 
     def ResolveIdentities(self):
@@ -59,7 +150,7 @@ class TemplateParser:
                     identities[i["thingSpecId1"]] = []
                 identities[i["thingSpecId1"]] += [i["thingSpecId2"]]
             for k,v in identities.items():
-                choice = random.choice(v)
+                choice = v[self.rngs["identities"].integers(len(v))]
                 resolved = False
                 for i in self.subtemplates:
                     for j in i.template["thingSpecs"]:
@@ -94,57 +185,61 @@ class TemplateParser:
         things = []
         for i in range(len(self.template["thingSpecs"])):
             if "generated" not in self.template["thingSpecs"][i]:
-                self.template["thingSpecs"][i]["value"] = str(uuid.UUID(hashlib.md5((self.originSource + json.dumps(self.template["thingSpecs"][i]) + str(random.random())).encode("utf-8")).hexdigest()))
+                self.template["thingSpecs"][i]["value"] = self.ids.Id(self.template["thingSpecs"][i]["id"])
                 self.template["thingSpecs"][i]["generated"] = True
                 self.template["thingSpecs"][i]["attributes"] = []            
                 if "attributeConstraints" in self.template["thingSpecs"][i]:
                     nval = {}
                     for j in self.template["thingSpecs"][i]["attributeConstraints"]:
                         if j["schemaAttribute"] not in nval.keys():
-                            nval[j["schemaAttribute"]] = self.AttributeGen(j["schemaAttribute"], j["attributeConstraintType"], j["value"], self.difficulty)
+                            nval[j["schemaAttribute"]] = self.AttributeGen(j["schemaAttribute"], j["attributeConstraintType"], j["value"], self.difficulty, self.rngs["attributes"])
                         else:
-                            nval[j["schemaAttribute"]] = nval[j["schemaAttribute"]] + self.AttributeGen(j["schemaAttribute"], j["attributeConstraintType"], j["value"], self.difficulty)
+                            nval[j["schemaAttribute"]] = nval[j["schemaAttribute"]] + self.AttributeGen(j["schemaAttribute"], j["attributeConstraintType"], j["value"], self.difficulty, self.rngs["attributes"])
                     for k,v in nval.items():
                         self.template["thingSpecs"][i]["attributes"] += [[k, v, 'value']]
         return self
 
-    def GenerateAttribute(self, attr, cond, condval, difficulty=0.5):
+    def GenerateAttribute(self, attr, cond, condval, difficulty=0.5, rng=None):
         """Default attribute generator function, generates random values that satisfy constraint"""
         attrValue = None
         if cond == "EQUALS":
             attrValue = condval
         elif cond == "ANY":
-            attrValue = RanString()
+            attrValue = RanString(rng)
         elif cond == "STRING_CONTAINS":
-            attrValue = RanString() + " " + condval + " " + RanString()
+            attrValue = RanString(rng) + " " + condval + " " + RanString(rng)
         elif cond == "LESS_THAN":
-            attrValue = random.uniform(0, float(condval) - SigDig(float(condval)))
+            attrValue = Uniform(0, float(condval) - SigDig(float(condval)), rng)
         elif cond == "LESS_THAN_OR_EQUAL":
-            attrValue = random.uniform(0, float(condval))
+            attrValue = Uniform(0, float(condval), rng)
         elif cond == "GREATER_THAN":
-            attrValue = random.uniform(float(condval) + SigDig(float(condval)), float(condval) + SigDig(float(condval))*2)
+            attrValue = Uniform(float(condval) + SigDig(float(condval)), float(condval) + SigDig(float(condval))*2, rng)
         elif cond == "GREATER_THAN_OR_EQUAL":
-            attrValue = random.uniform(float(condval), float(condval) + SigDig(float(condval)))
+            attrValue = Uniform(float(condval), float(condval) + SigDig(float(condval)), rng)
         return attrValue
 
     def GenerateRelationships(self):
         """Function to satisfy relationship specs in template"""
         if "relationshipSpecs" in self.template.keys():
+            self.Compile()
             for j,i in enumerate(self.template["relationshipSpecs"]):
                 if "generated" not in i.keys():
-                    x = DictIndex(self.template["thingSpecs"], "id", i["node1"])
-                    y = DictIndex(self.template["thingSpecs"], "id", i["node2"])
-                    self.template["thingSpecs"][x]["attributes"] += [[i["edge"], self.template["thingSpecs"][y]["value"], 'object']]
+                    x = self.ir.ThingIndex(i["node1"])
+                    y = self.ir.ThingIndex(i["node2"])
+                    self.ir.AddAttributes(x, [[i["edge"], self.template["thingSpecs"][y]["value"], 'object']])
                     self.template["relationshipSpecs"][j]["generated"] = True
         return self
 
     def GenerateComparisons(self, simdiff = False, simgeo=True, presortConstraints=False, thing=None):
-        """Function to satisfy comparison constraints in template"""
+        """Function to satisfy comparison constraints in template, constraints are taken in template order and after each one the remaining constraints of its two things are satisfied, each thing keeps a cursor into its constraint list so every constraint is visited once"""
         #logger.debug('Creating comparison constraints between nodes in the template.')
         if "comparisonConstraints" not in self.template.keys():
             return self
         if presortConstraints:
             self.template["comparisonConstraints"] = sorted(self.template["comparisonConstraints"], reverse=True, key=lambda x: x['constraint']['minValue'] if 'minValue' in x['constraint'].keys() else 0)
+        self.Compile()
+        locsdict = {}
+        tmsdict = {}
         if simgeo:
             edges = []
             for j,i in enumerate(self.template["comparisonConstraints"]):
@@ -152,7 +247,7 @@ class TemplateParser:
                     edges += [[i["thing1"],i["thing2"],i["constraint"]["maxValue"]]]
             if len(edges) > 0:
                 edges = sorted(edges, key = lambda x: x[0])
-                locs = GenerateDynGeo(edges, [[edges[0][0], RandLatLon(self.lat, self.lon, 500)]], edges[0][1])
+                locs = GenerateDynGeo(edges, [[edges[0][0], RandLatLon(self.lat, self.lon, 500, self.rngs["geo"])]], edges[0][1], self.rngs["geo"], self.metrics)
                 locsdict = {i[0]:i[1] for i in locs}
         if simdiff:
             edges = []
@@ -161,132 +256,162 @@ class TemplateParser:
                     edges += [[i["thing1"],i["thing2"],(i["constraint"]["minValue"], i["constraint"]["maxValue"])]]
             if len(edges) > 0:
                 edges = sorted(edges, key = lambda x: x[0])
-                tms = GenerateDynDiff(edges, [[edges[0][0], 0]], edges[0][1])
+                tms = GenerateDynDiff(edges, [[edges[0][0], 0]], edges[0][1], self.rngs["diff"], self.metrics)
                 tmsdict = {i[0]:i[1] for i in tms}
         now = datetime.datetime.utcfromtimestamp(self.initdate)
-        for j,i in enumerate(self.template["comparisonConstraints"]):
-            if "generated" not in self.template["comparisonConstraints"][j].keys():
-                x = DictIndex(self.template["thingSpecs"], "id", i["thing1"])
-                y = DictIndex(self.template["thingSpecs"], "id", i["thing2"])
-                xattr = AttrIndex(self.template["thingSpecs"][x]["attributes"], i["schemaAttribute1"])
-                yattr = AttrIndex(self.template["thingSpecs"][y]["attributes"], i["schemaAttribute2"])
-                if thing != None and i["thing1"] != thing and i["thing2"] != thing:
-                    continue
-                if "predicate" in i["constraint"].keys() and i["constraint"]["predicate"] == "EQUALS":
-                    aval = None
-                    bval = None
-                    for k,v in enumerate(self.template["thingSpecs"][x]["attributes"]):
-                        if v[0] == i["schemaAttribute1"]:
-                            aval = v[1]
-                    for k,v in enumerate(self.template["thingSpecs"][y]["attributes"]):
-                        if v[0] == i["schemaAttribute2"]:
-                            bval = v[1]
-                    if aval != None and aval == bval:
-                        None
-                    elif aval == None and bval == None:
-                        nval = self.AttributeGen(i["schemaAttribute1"], "ANY", "", self.difficulty)
-                        xattr = [i["schemaAttribute1"], self.AttributeGen(i["schemaAttribute1"], "EQUALS", nval, self.difficulty), 'value']
-                        yattr = [i["schemaAttribute2"], self.AttributeGen(i["schemaAttribute2"], "EQUALS", nval, self.difficulty), 'value']
-                        self.template["thingSpecs"][x]["attributes"] += [xattr]
-                        self.template["thingSpecs"][y]["attributes"] += [yattr]
-                    elif aval != None and bval == None:
-                        attr = [i["schemaAttribute2"], aval, 'value']
-                        self.template["thingSpecs"][y]["attributes"] += [attr]
-                    elif aval == None and bval != None:
-                        attr = [i["schemaAttribute1"], bval, 'value']
-                        self.template["thingSpecs"][x]["attributes"] += [attr]
-                    self.template["comparisonConstraints"][j]["generated"] = True
-                if "differenceConstraint" in i["constraint"].keys() and i["constraint"]["differenceConstraint"] == "true":
-                    aval = None
-                    bval = None
-                    for k,v in enumerate(self.template["thingSpecs"][x]["attributes"]):
-                        if v[0] == i["schemaAttribute1"]:
-                            aval = v[1]
-                    for k,v in enumerate(self.template["thingSpecs"][y]["attributes"]):
-                        if v[0] == i["schemaAttribute2"]:
-                            bval = v[1]
-
-                    cval = 0
-                    if "minValue" in i["constraint"].keys():
-                        cval = int(i["constraint"]["minValue"])
-                        if "maxValue" in i["constraint"].keys():
-                            if 0 >= int(i["constraint"]["minValue"]) and 0 <= int(i["constraint"]["maxValue"]):
-                                cval = 0
+        anchors = LatLonPool(self.lat, self.lon, 500, self.rngs["geo"], max(1, len([i for i in self.template["comparisonConstraints"] if "norm" in i["constraint"].keys() and i["constraint"]["norm"] == "GEO_DISTANCE"])))
+        cursors = {}
+        worklist = self.ir.Constraints() if thing == None else []
+        for j in worklist:
+            if self.GenerateComparison(j, now, simdiff, simgeo, locsdict, tmsdict, anchors):
+                for k in dict.fromkeys([self.template["comparisonConstraints"][j]["thing1"], self.template["comparisonConstraints"][j]["thing2"]]):
+                    self.GenerateThingComparisons(k, cursors, now, simdiff, simgeo, locsdict, tmsdict, anchors)
+        if thing != None:
+            self.GenerateThingComparisons(thing, cursors, now, simdiff, simgeo, locsdict, tmsdict, anchors)
+        return self
 
-                    if aval != None and aval == bval:
-                        None
-                    elif aval == None and bval == None:
-                        nval = self.AttributeGen(i["schemaAttribute1"], "ANY", "", self.difficulty)
-                        if type(nval) == str:
-                            nval = now
-                        xattr = [i["schemaAttribute1"], self.AttributeGen(i["schemaAttribute1"], "EQUALS", nval + datetime.timedelta(days= (tmsdict[i["thing1"]] if simdiff else cval)), self.difficulty), 'value']
-                        yattr = [i["schemaAttribute2"], self.AttributeGen(i["schemaAttribute2"], "EQUALS", nval + datetime.timedelta(days= (tmsdict[i["thing2"]] if simdiff else 0)), self.difficulty), 'value']
-                        self.template["thingSpecs"][x]["attributes"] += [xattr]
-                        self.template["thingSpecs"][y]["attributes"] += [yattr]
-                    elif aval != None and bval == None:
-                        nval = aval - datetime.timedelta(days=(tmsdict[i["thing1"]]-tmsdict[i["thing2"]] if simdiff else cval))
-                        attr = [i["schemaAttribute2"], nval, 'value']
-                        self.template["thingSpecs"][y]["attributes"] += [attr]
-                    elif aval == None and bval != None:
-                        nval = bval + datetime.timedelta(days=(tmsdict[i["thing1"]]-tmsdict[i["thing2"]] if simdiff else cval))
-                        attr = [i["schemaAttribute1"], nval, 'value']
-                        self.template["thingSpecs"][x]["attributes"] += [attr]
-                    self.template["comparisonConstraints"][j]["generated"] = True
-                if "norm" in i["constraint"].keys() and i["constraint"]["norm"] == "GEO_DISTANCE":
-                    if xattr == None and yattr == None:
-                        self.template["thingSpecs"][x]["attributes"] += [[i["schemaAttribute1"], locsdict[i["thing1"]] if simgeo else RandLatLon(self.lat, self.lon, 500), 'geojson']]
-                        xattr = AttrIndex(self.template["thingSpecs"][x]["attributes"], i["schemaAttribute1"])
-                    if xattr != None:
-                        xlat = self.template["thingSpecs"][x]["attributes"][xattr][1][0]
-                        xlon = self.template["thingSpecs"][x]["attributes"][xattr][1][1]
-                        nlatlon = locsdict[i["thing2"]] if simgeo else RandLatLon(xlat, xlon, i["constraint"]["maxValue"])
-                        distance = geopy.distance.geodesic([xlat, xlon],nlatlon).meters
-                        self.template["thingSpecs"][y]["attributes"] += [[i["schemaAttribute2"], nlatlon, 'geojson']]
-                        if distance > i["constraint"]["maxValue"]:
-                            print("GEO_DISTANCE VIOLATED", x, y)
-                    elif yattr != None:
-                        ylat = self.template["thingSpecs"][y]["attributes"][yattr][1][0]
-                        ylon = self.template["thingSpecs"][y]["attributes"][yattr][1][1]
-                        nlatlon = locsdict[i["thing1"]] if simgeo else RandLatLon(ylat, ylon, i["constraint"]["maxValue"])
-                        distance = geopy.distance.geodesic([ylat, ylon],nlatlon).meters
-                        self.template["thingSpecs"][x]["attributes"] += [[i["schemaAttribute2"], nlatlon, 'geojson']]
-                        if distance > i["constraint"]["maxValue"]:
-                            print("GEO_DISTANCE VIOLATED", x, y)
-                    else:
-                        xlat = self.template["thingSpecs"][x]["attributes"][xattr][1][0]
-                        xlon = self.template["thingSpecs"][x]["attributes"][xattr][1][1]
-                        ylat = self.template["thingSpecs"][y]["attributes"][yattr][1][0]
-                        ylon = self.template["thingSpecs"][y]["attributes"][yattr][1][1]
-                        distance = geopy.distance.geodesic([xlat, xlon],[ylat, ylon]).meters
-                        if distance > i["constraint"]["maxValue"]:
-                            print("GEO_DISTANCE VIOLATED", x, y)
-                    self.template["comparisonConstraints"][j]["generated"] = True
-                if i["thing1"] == thing or thing == None:
-                    self.GenerateComparisons(simdiff,simgeo,presortConstraints,i["thing1"])
-                if i["thing2"] == thing or thing == None:
-                    self.GenerateComparisons(simdiff,simgeo,presortConstraints,i["thing2"])
+    def GenerateThingComparisons(self, thing, cursors, now, simdiff, simgeo, locsdict, tmsdict, anchors):
+        """Function to satisfy the comparison constraints of a thing that have not been generated, resuming from the thing's cursor"""
+        constraints = self.ir.Constraints(thing)
+        cursor = cursors[thing] if thing in cursors.keys() else 0
+        while cursor < len(constraints):
+            self.GenerateComparison(constraints[cursor], now, simdiff, simgeo, locsdict, tmsdict, anchors)
+            cursor += 1
+        cursors[thing] = cursor
         return self
 
+    def GenerateComparison(self, j, now, simdiff, simgeo, locsdict, tmsdict, anchors):
+        """Function to satisfy one comparison constraint, returns False if it had already been generated"""
+        i = self.template["comparisonConstraints"][j]
+        if "generated" in i.keys():
+            return False
+        self.metrics.Count('comparison_constraints')
+        x = self.ir.ThingIndex(i["thing1"])
+        y = self.ir.ThingIndex(i["thing2"])
+        xattr = self.ir.AttrIndex(x, i["schemaAttribute1"])
+        yattr = self.ir.AttrIndex(y, i["schemaAttribute2"])
+        if "predicate" in i["constraint"].keys() and i["constraint"]["predicate"] == "EQUALS":
+            aval = self.ir.AttrValue(x, i["schemaAttribute1"])
+            bval = self.ir.AttrValue(y, i["schemaAttribute2"])
+            if aval != None and aval == bval:
+                None
+            elif aval == None and bval == None:
+                nval = self.AttributeGen(i["schemaAttribute1"], "ANY", "", self.difficulty, self.rngs["attributes"])
+                xattr = [i["schemaAttribute1"], self.AttributeGen(i["schemaAttribute1"], "EQUALS", nval, self.difficulty, self.rngs["attributes"]), 'value']
+                yattr = [i["schemaAttribute2"], self.AttributeGen(i["schemaAttribute2"], "EQUALS", nval, self.difficulty, self.rngs["attributes"]), 'value']
+                self.ir.AddAttributes(x, [xattr])
+                self.ir.AddAttributes(y, [yattr])
+            elif aval != None and bval == None:
+                attr = [i["schemaAttribute2"], aval, 'value']
+                self.ir.AddAttributes(y, [attr])
+            elif aval == None and bval != None:
+                attr = [i["schemaAttribute1"], bval, 'value']
+                self.ir.AddAttributes(x, [attr])
+            self.template["comparisonConstraints"][j]["generated"] = True
+        if "differenceConstraint" in i["constraint"].keys() and i["constraint"]["differenceConstraint"] == "true":
+            aval = self.ir.AttrValue(x, i["schemaAttribute1"])
+            bval = self.ir.AttrValue(y, i["schemaAttribute2"])
+
+            cval = 0
+            if "minValue" in i["constraint"].keys():
+                cval = int(i["constraint"]["minValue"])
+                if "maxValue" in i["constraint"].keys():
+                    if 0 >= int(i["constraint"]["minValue"]) and 0 <= int(i["constraint"]["maxValue"]):
+                        cval = 0
+
+            if aval != None and aval == bval:
+                None
+            elif aval == None and bval == None:
+                nval = self.AttributeGen(i["schemaAttribute1"], "ANY", "", self.difficulty, self.rngs["attributes"])
+                if type(nval) == str:
+                    nval = now
+                xattr = [i["schemaAttribute1"], self.AttributeGen(i["schemaAttribute1"], "EQUALS", nval + datetime.timedelta(days= (tmsdict[i["thing1"]] if simdiff else cval)), self.difficulty, self.rngs["attributes"]), 'value']
+                yattr = [i["schemaAttribute2"], self.AttributeGen(i["schemaAttribute2"], "EQUALS", nval + datetime.timedelta(days= (tmsdict[i["thing2"]] if simdiff else 0)), self.difficulty, self.rngs["attributes"]), 'value']
+                self.ir.AddAttributes(x, [xattr])
+                self.ir.AddAttributes(y, [yattr])
+            elif aval != None and bval == None:
+                nval = aval - datetime.timedelta(days=(tmsdict[i["thing1"]]-tmsdict[i["thing2"]] if simdiff else cval))
+                attr = [i["schemaAttribute2"], nval, 'value']
+                self.ir.AddAttributes(y, [attr])
+            elif aval == None and bval != None:
+                nval = bval + datetime.timedelta(days=(tmsdict[i["thing1"]]-tmsdict[i["thing2"]] if simdiff else cval))
+                attr = [i["schemaAttribute1"], nval, 'value']
+                self.ir.AddAttributes(x, [attr])
+            self.template["comparisonConstraints"][j]["generated"] = True
+        if "norm" in i["constraint"].keys() and i["constraint"]["norm"] == "GEO_DISTANCE":
+            if xattr == None and yattr == None:
+                self.ir.AddAttributes(x, [[i["schemaAttribute1"], locsdict[i["thing1"]] if simgeo else anchors.Next(), 'geojson']])
+                xattr = self.ir.AttrIndex(x, i["schemaAttribute1"])
+            if xattr != None:
+                xlat = self.template["thingSpecs"][x]["attributes"][xattr][1][0]
+                xlon = self.template["thingSpecs"][x]["attributes"][xattr][1][1]
+                nlatlon = locsdict[i["thing2"]] if simgeo else RandLatLon(xlat, xlon, i["constraint"]["maxValue"], self.rngs["geo"])
+                distance = geopy.distance.geodesic([xlat, xlon],nlatlon).meters
+                self.ir.AddAttributes(y, [[i["schemaAttribute2"], nlatlon, 'geojson']])
+                if distance > i["constraint"]["maxValue"]:
+                    print("GEO_DISTANCE VIOLATED", x, y)
+            elif yattr != None:
+                ylat = self.template["thingSpecs"][y]["attributes"][yattr][1][0]
+                ylon = self.template["thingSpecs"][y]["attributes"][yattr][1][1]
+                nlatlon = locsdict[i["thing1"]] if simgeo else RandLatLon(ylat, ylon, i["constraint"]["maxValue"], self.rngs["geo"])
+                distance = geopy.distance.geodesic([ylat, ylon],nlatlon).meters
+                self.ir.AddAttributes(x, [[i["schemaAttribute2"], nlatlon, 'geojson']])
+                if distance > i["constraint"]["maxValue"]:
+                    print("GEO_DISTANCE VIOLATED", x, y)
+            else:
+                xlat = self.template["thingSpecs"][x]["attributes"][xattr][1][0]
+                xlon = self.template["thingSpecs"][x]["attributes"][xattr][1][1]
+                ylat = self.template["thingSpecs"][y]["attributes"][yattr][1][0]
+                ylon = self.template["thingSpecs"][y]["attributes"][yattr][1][1]
+                distance = geopy.distance.geodesic([xlat, xlon],[ylat, ylon]).meters
+                if distance > i["constraint"]["maxValue"]:
+                    print("GEO_DISTANCE VIOLATED", x, y)
+            self.template["comparisonConstraints"][j]["generated"] = True
+        return True
+
 
     def GenerateRDF(self, trim = False):
         """Function to generate triples list from template"""
+        triples = list(self.IterRDF(trim))
+        self.rdf += triples
+        self.metrics.Count('triples', len(triples))
+        return self
+
+    def IterRDF(self, trim = False):
+        """Function that yields the triples of the template one at a time, things without attributes are yielded last"""
+        rdftype = '<' + schema_grapher.util.RDFTYPE + '>'
         empty = []
         for i in self.template["thingSpecs"]:
-            dedup = set(tuple(tuple(y) if type(y) is list else y for y in x) for x in i["attributes"])
+            dedup = dict.fromkeys(tuple(tuple(y) if type(y) is list else y for y in x) for x in i["attributes"])
             if len(dedup) > 0:
-                self.rdf += [(schema_grapher.util.WrapNS(i["value"]), '<' + schema_grapher.util.RDFTYPE + '>', schema_grapher.util.WrapNS(i["schemaClass"]))]
-                self.rdf += [(schema_grapher.util.WrapNS(i["value"]), schema_grapher.util.WrapNS("metaData"), schema_grapher.util.ParseDatum("metaData", json.dumps({"answerKey" : str(self.originSource) + '|' + i["id"]}), self.pt))]
+                subject = schema_grapher.util.WrapNS(i["value"])
+                yield (subject, rdftype, self.terms.IRI(i["schemaClass"]))
+                yield (subject, self.terms.IRI("metaData"), schema_grapher.util.ParseDatum("metaData", json.dumps({"answerKey" : str(self.originSource) + '|' + i["id"]}), self.pt))
                 for j in dedup:
                     if j[2] == 'object':
-                        self.rdf += [(schema_grapher.util.WrapNS(i["value"]), schema_grapher.util.WrapNS(j[0]), schema_grapher.util.WrapNS(j[1]))]
+                        yield (subject, self.terms.IRI(j[0]), schema_grapher.util.WrapNS(j[1]))
                     elif j[2] == 'geojson':
-                        self.rdf += [(schema_grapher.util.WrapNS(i["value"]), schema_grapher.util.WrapNS(j[0]), schema_grapher.util.ParseDatum(j[0], {"type": "Point", "coordinates": [float(j[1][1]), float(j[1][0])]}, self.pt))]
+                        yield (subject, self.terms.IRI(j[0]), self.terms.Point(j[0], j[1]))
                     else:
-                        self.rdf += [(schema_grapher.util.WrapNS(i["value"]), schema_grapher.util.WrapNS(j[0]), schema_grapher.util.ParseDatum(j[0], j[1], self.pt))]
+                        yield (subject, self.terms.IRI(j[0]), self.terms.Datum(j[0], j[1]))
             elif not trim:
                 empty += [(schema_grapher.util.WrapNS(i["value"]), '<' + schema_grapher.util.RDFTYPE + '>', schema_grapher.util.WrapNS(i["schemaClass"]))]
                 empty += [(schema_grapher.util.WrapNS(i["value"]), schema_grapher.util.WrapNS("metaData"), schema_grapher.util.ParseDatum("metaData", json.dumps({"answerKey" : str(self.originSource) + '|' + i["id"]}), self.pt))]
-        self.rdf += empty
+        yield from empty
+
+    def StreamTriples(self, fwrite, trim = False, compress = None, flushsize = FLUSH_SIZE):
+        """Function to generate the triples of the template and write them to a file as they are produced instead of keeping them in memory"""
+        with self.metrics.Stage('StreamTriples'):
+            with TripleWriter(fwrite, compress, flushsize) as writer:
+                writer.WriteAll(self.IterRDF(trim))
+        self.metrics.Count('triples', writer.count)
+        return self
+
+    def WriteSignal(self, writer, name, trim = False):
+        """Function to generate the triples of the template and append them to a ShardedWriter as one signal"""
+        with self.metrics.Stage('WriteSignal'):
+            entry = writer.WriteSignal(name, self.originSource, self.IterRDF(trim))
+        self.metrics.Count('triples', entry['triples'])
         return self
 
     def WriteTemplate(self, fwrite):
@@ -297,6 +422,7 @@ class TemplateParser:
     
     def WriteTriples(self, fwrite):
         """Function to write out n-triples to a file"""
-        with open(fwrite, 'w') as f:
-            f.write(schema_grapher.util.RenderTriples(self.rdf))
+        with self.metrics.Stage('WriteTriples'):
+            with open(fwrite, 'w') as f:
+                f.write(schema_grapher.util.RenderTriples(self.rdf))
         return self
@@ -25,7 +25,8 @@ baseURI = 'http://schema.localhost/'
 class TemplateParserV1:
     """Class to parse V1.0 and V1.2 templates and generate signals"""
     TEMPLATE_VERSION = ['V1.0', 'V1.2']
-    def __init__(self, jfile, cdir, pt, lat, lon, seed, initdate, difficulty=0.5, attributegen=None, partial=None):
+    RANDOM_STREAMS = ['attributes', 'ids', 'geo', 'fakes', 'partial']
+    def __init__(self, jfile, cdir, pt, lat, lon, seed, initdate, difficulty=0.5, attributegen=None, partial=None, seedseq=None, geocoder=None):
         jtemp = None
         if type(jfile) is str and os.path.isfile(jfile):
             with open(jfile) as f:
@@ -43,10 +44,20 @@ class TemplateParserV1:
         self.originSource = self.template["id"] + "|" + str(difficulty) + "|" + str(seed) + "." + str(initdate)
         self.rdf = []
         self.difficulty=difficulty
-        self.AttributeGen = self.GenerateAttribute if attributegen == None else attributegen
+        self.attributefn = self.GenerateAttribute if attributegen == None else attributegen
+        self.attributerng = AcceptsRng(self.attributefn)
+        self.AttributeGen = self.MeteredAttribute
+        self.attributegen = attributegen
         self.partial = partial
+        self.geocoder = geocoder
         self.subtemplates = []
         self.components = {}
+        self.snapshot = None
+        self.terms = TermCache(pt)
+        self.rngs, self.seedseq = RandomStreams(seed if seedseq == None else seedseq, self.RANDOM_STREAMS)
+        self.signalSource = self.originSource if partial == None else self.originSource + "|" + json.dumps(partial, sort_keys=True)
+        self.ids = ThingIds(self.signalSource)
+        self.metrics = Metrics()
 
     def LoadComponents(self):
         """Function that reads components from a directory"""
@@ -73,18 +84,92 @@ class TemplateParserV1:
                                 k['dataTypePropertyConstraints'] = j['dataTypePropertyConstraints']
         return self
         
+    def Prepare(self):
+        """Function that does the seed independent work once, loading and merging the components and keeping a serialized snapshot of the template that instances are copied from"""
+        if self.snapshot == None:
+            if len(self.components) == 0:
+                with self.metrics.Stage('LoadComponents'):
+                    self.LoadComponents()
+                with self.metrics.Stage('MergeHydratedToTemplate'):
+                    self.MergeHydratedToTemplate()
+            self.snapshot = json.dumps(self.template)
+        return self
+
+    def Instance(self, seed, difficulty=None, partial=None):
+        """Function that returns a new parser for a seed and difficulty from the prepared template without reading, loading or merging components again"""
+        self.Prepare()
+        instance = TemplateParserV1(json.loads(self.snapshot), self.cdir, self.pt, self.lat, self.lon, seed, self.initdate, self.difficulty if difficulty == None else difficulty, self.attributegen, self.partial if partial == None else partial, geocoder=self.geocoder)
+        instance.components = self.components
+        instance.snapshot = self.snapshot
+        instance.terms = self.terms
+        return instance
+
+    def Generate(self, rdf=True):
+        """Function that runs the seed dependent generation steps of an instance and times each one, the triples are left to StreamTriples when rdf is False"""
+        for stage in ['GenerateThings', 'GenerateComparisons', 'GenerateFakes'] + (['GenerateRDF'] if rdf else []):
+            with self.metrics.Stage(stage):
+                getattr(self, stage)()
+        return self
+
+    def MeteredAttribute(self, attr, cond, condval, difficulty=0.5, rng=None):
+        """Function that counts a call of the attribute generator and passes it on, with the random generator only when the attribute generator takes one"""
+        self.metrics.Count('attribute_calls')
+        if not self.attributerng:
+            return self.attributefn(attr, cond, condval, difficulty)
+        return self.attributefn(attr, cond, condval, difficulty, rng)
+
+    def Report(self):
+        """Function that returns the stage times and counters of the signal as a dictionary that can be written as JSON"""
+        report = self.metrics.Report()
+        report.update({'template': self.template["id"], 'originSource': self.originSource, 'seed': self.seed, 'difficulty': self.difficulty})
+        return report
+
+    def GenerateInstances(self, instances):
+        """Function that generates a signal for each (seed, difficulty) or (seed, difficulty, partial) tuple from the prepared template, yields the generated parsers"""
+        self.Prepare()
+        for i in instances:
+            yield self.Instance(*i).Generate()
+
+    def PlanAttributes(self):
+        """Function that lists the schema attributes whose values will be drawn during generation, from the data type property constraints of the merged components and the equality and difference comparison constraints"""
+        self.Prepare()
+        attrs = []
+        for ix in self.template["templateComponents"]:
+            for kx in [ix['hydratedThingSpec']['rootThing']] + ix['hydratedThingSpec']['thingPropertyConstraints']:
+                for j in kx["dataTypePropertyConstraints"] if "dataTypePropertyConstraints" in kx.keys() else []:
+                    conds = j['equals'] if 'equals' in j.keys() else j['and'] if 'and' in j.keys() else j['or'] if 'or' in j.keys() else [j]
+                    for k in conds:
+                        kkey = list(k.keys())[0]
+                        if kkey != 'equals':
+                            attrs += [k[kkey]['leftHandSide'] if type(k[kkey]) is dict else k[kkey][0]]
+        if "templateComponentComparisonConstraints" in self.template.keys():
+            for i in self.template['templateComponentComparisonConstraints']:
+                if 'equals' in i.keys():
+                    attrs += [i['equals'][0].split('.')[-1]]
+                if 'difference' in i.keys():
+                    attrs += [i['difference']['subtrahend'].split('.')[-1]]
+        return list(dict.fromkeys(attrs))
+
+    def PrefetchAttributes(self, num_threads=PREFETCH_THREADS):
+        """Function that loads the counts of the planned attributes into the attribute generator, when it supports prefetching, before any instance is generated"""
+        agen = getattr(self.attributegen, '__self__', self.attributegen)
+        if hasattr(agen, 'Prefetch'):
+            agen.Prefetch(self.PlanAttributes(), num_threads)
+        return self
+
     def GenerateThings(self):
         """Function that generates values for things"""
         things = []
         for i,ix in enumerate(self.template["templateComponents"]):
-            ix['hydratedThingSpec']['rootThing']["value"] = str(uuid.UUID(hashlib.md5((self.originSource + json.dumps(ix) + str(random.random())).encode("utf-8")).hexdigest()))
+            alias = ix['alias'] if 'alias' in ix.keys() else str(i)
+            ix['hydratedThingSpec']['rootThing']["value"] = self.ids.Id(alias + '.root')
             ix['hydratedThingSpec']['rootThing']["generated"] = True
             ix['hydratedThingSpec']['rootThing']["attributes"] = []
             if "dataTypePropertyConstraints" in ix['hydratedThingSpec']['rootThing']:
                 ix['hydratedThingSpec']['rootThing']["attributes"] = self.GenerateDataTypePropertyConstraint(ix['hydratedThingSpec']['rootThing'])
             for k,kx in enumerate(ix['hydratedThingSpec']['thingPropertyConstraints']):
                 if "generated" not in kx.keys():
-                    kx["value"] = str(uuid.UUID(hashlib.md5((self.originSource + json.dumps(kx) + str(random.random())).encode("utf-8")).hexdigest()))
+                    kx["value"] = self.ids.Id(alias + '.root.' + kx['pathFromRoot'])
                     kx["generated"] = True
                     kx["attributes"] = []
                     if "dataTypePropertyConstraints" in kx:
@@ -101,49 +186,49 @@ class TemplateParserV1:
                 for k in j['equals']:
                     kvals = list(k.values())[0]
                     kkeys = list(k.keys())
-                    nval[kvals[0]] = self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty)
+                    nval[kvals[0]] = self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty, self.rngs["attributes"])
             elif 'and' in j.keys():
                 for k in j['and']:
                     kvals = list(k.values())[0]
                     kkeys = list(k.keys())
                     if kvals[0] not in tuple(nval.keys()):
-                        nval[kvals[0]] = self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty)
+                        nval[kvals[0]] = self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty, self.rngs["attributes"])
                     else:
-                        nval[kvals[0]] = nval[kvals[0]] + self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty)
+                        nval[kvals[0]] = nval[kvals[0]] + self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty, self.rngs["attributes"])
                 
             elif 'or' in j.keys():
                 for k in j['or']:
                     kvals = list(k.values())[0]
                     kkeys = list(k.keys())
                     if kvals[0] not in tuple(nval.keys()):
-                        nval[kvals[0]] = self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty)
+                        nval[kvals[0]] = self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty, self.rngs["attributes"])
                     else:
-                        nval[kvals[0]] = nval[kvals[0]] + self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty)
+                        nval[kvals[0]] = nval[kvals[0]] + self.AttributeGen(kvals[0], kkeys[0], kvals[1], self.difficulty, self.rngs["attributes"])
             else:
                 jkeys = list(j.keys())
                 jvals = list(j.values())[0] if type(j[jkeys[0]]) is not dict else [j[jkeys[0]]['leftHandSide'], j[jkeys[0]]['rightHandSide']['value']]
-                nval[jvals[0]] = self.AttributeGen(jvals[0], jkeys[0], jvals[1], self.difficulty)
+                nval[jvals[0]] = self.AttributeGen(jvals[0], jkeys[0], jvals[1], self.difficulty, self.rngs["attributes"])
         for k,v in nval.items():
             attributes += [[k, v, 'value']]
         return attributes
 
-    def GenerateAttribute(self, attr, cond, condval, difficulty=0.5):
+    def GenerateAttribute(self, attr, cond, condval, difficulty=0.5, rng=None):
         """Default attribute generator function, generates random values that satisfy constraint"""
         attrValue = None
         if cond == "equals":
             attrValue = condval
         elif cond == "any":
-            attrValue = RanString()
+            attrValue = RanString(rng)
         elif cond == "stringLike":
-            attrValue = RanString() + " " + condval + " " + RanString()
+            attrValue = RanString(rng) + " " + condval + " " + RanString(rng)
         elif cond == "lessThan":
-            attrValue = random.uniform(0, float(condval) - SigDig(float(condval)))
+            attrValue = Uniform(0, float(condval) - SigDig(float(condval)), rng)
         elif cond == "lessThanOrEquals":
-            attrValue = random.uniform(0, float(condval))
+            attrValue = Uniform(0, float(condval), rng)
         elif cond == "greaterThan":
-            attrValue = random.uniform(float(condval) + SigDig(float(condval)), float(condval) + SigDig(float(condval))*2)
+            attrValue = Uniform(float(condval) + SigDig(float(condval)), float(condval) + SigDig(float(condval))*2, rng)
         elif cond == "greaterThanOrEquals":
-            attrValue = random.uniform(float(condval), float(condval) + SigDig(float(condval)))
+            attrValue = Uniform(float(condval), float(condval) + SigDig(float(condval)), rng)
         return attrValue
 
     def GetValueFromPath(self, path):
@@ -173,7 +258,9 @@ class TemplateParserV1:
         #logger.debug('Creating comparison constraints between nodes in the template.')
         if "templateComponentComparisonConstraints" not in self.template.keys():
             return self
+        anchors = LatLonPool(self.lat, self.lon, 500, self.rngs["geo"], max(1, len([i for i in self.template['templateComponentComparisonConstraints'] if "geoNear" in i.keys()])))
         for i in self.template['templateComponentComparisonConstraints']:
+            self.metrics.Count('comparison_constraints')
             for k,v in i.items():
                 if k == 'equals':
                     values = {}
@@ -186,7 +273,7 @@ class TemplateParserV1:
                                 if a[0] == jk.split('.')[-1]:
                                     attrs += [a[1]]
                     if len(attrs) == 0:
-                        attrs += [self.AttributeGen(list(values.keys())[0].split('.')[-1], 'any', '', self.difficulty)]
+                        attrs += [self.AttributeGen(list(values.keys())[0].split('.')[-1], 'any', '', self.difficulty, self.rngs["attributes"])]
                     for jk, jv in values.items():
                         attrset = None
                         if len(jv['attributes']) > 0:
@@ -212,11 +299,11 @@ class TemplateParserV1:
                     if aval != None and aval == bval:
                         None
                     elif aval == None and bval == None:
-                        nval = self.AttributeGen(schemaAttribute1, "ANY", "", self.difficulty)
+                        nval = self.AttributeGen(schemaAttribute1, "ANY", "", self.difficulty, self.rngs["attributes"])
                         if type(nval) == str:
                             nval = now
-                        xattr = [schemaAttribute1, self.AttributeGen(schemaAttribute1, "EQUALS", nval - datetime.timedelta(days=cval), self.difficulty), 'value']
-                        yattr = [schemaAttribute2, self.AttributeGen(schemaAttribute2, "EQUALS", nval + datetime.timedelta(days=0), self.difficulty), 'value']
+                        xattr = [schemaAttribute1, self.AttributeGen(schemaAttribute1, "EQUALS", nval - datetime.timedelta(days=cval), self.difficulty, self.rngs["attributes"]), 'value']
+                        yattr = [schemaAttribute2, self.AttributeGen(schemaAttribute2, "EQUALS", nval + datetime.timedelta(days=0), self.difficulty, self.rngs["attributes"]), 'value']
                         subtrahend["attributes"] += [xattr]
                         minuend["attributes"] += [yattr]
                     elif aval != None and bval == None:
@@ -232,35 +319,20 @@ class TemplateParserV1:
                     second = self.GetValueFromPath(v['geometries'][1])
                     schemaAttribute1 = v['geometries'][0].split('.')[-1]
                     schemaAttribute2 = v['geometries'][1].split('.')[-1]
-                    xattr = self.GetAttrFromThing(first, schemaAttribute1)
-                    yattr = self.GetAttrFromThing(second, schemaAttribute2)
-                    if xattr == None and yattr == None:
-                        first["attributes"] += [[schemaAttribute1, RandLatLon(self.lat, self.lon, 500), 'geojson']]
-                        xattr = AttrIndex(first["attributes"], schemaAttribute1)
-                    if xattr != None:
-                        xlat = xattr[1][0]
-                        xlon = xattr[1][1]
-                        nlatlon = RandLatLon(xlat, xlon, v["distance"])
-                        distance = geopy.distance.geodesic([xlat, xlon],nlatlon).meters
-                        second["attributes"] += [[schemaAttribute2, nlatlon, 'geojson']]
-                        if distance > v["distance"]:
-                            print("GEO_DISTANCE VIOLATED", x, y)
-                    elif yattr != None:
-                        ylat = yattr[1][0]
-                        ylon = yattr[1][1]
-                        nlatlon = RandLatLon(ylat, ylon, v["distance"])
-                        distance = geopy.distance.geodesic([ylat, ylon],nlatlon).meters
-                        first["attributes"] += [[schemaAttribute2, nlatlon, 'geojson']]
-                        if distance > v["distance"]:
-                            print("GEO_DISTANCE VIOLATED", x, y)
-                    else:
-                        xlat = xattr[1][0]
-                        xlon = xattr[1][1]
-                        ylat = yattr[1][0]
-                        ylon = yattr[1][1]
-                        distance = geopy.distance.geodesic([xlat, xlon],[ylat, ylon]).meters
-                        if distance > v["distance"]:
-                            print("GEO_DISTANCE VIOLATED", x, y)
+                    xloc = self.GetAttrFromThing(first, schemaAttribute1)
+                    yloc = self.GetAttrFromThing(second, schemaAttribute2)
+                    if xloc == None and yloc == None:
+                        xloc = anchors.Next()
+                        first["attributes"] += [[schemaAttribute1, xloc, 'geojson']]
+                    if yloc == None:
+                        yloc = RandLatLon(xloc[0], xloc[1], v["distance"], self.rngs["geo"])
+                        second["attributes"] += [[schemaAttribute2, yloc, 'geojson']]
+                    elif xloc == None:
+                        xloc = RandLatLon(yloc[0], yloc[1], v["distance"], self.rngs["geo"])
+                        first["attributes"] += [[schemaAttribute1, xloc, 'geojson']]
+                    distance = geopy.distance.geodesic(xloc, yloc).meters
+                    if distance > v["distance"]:
+                        print("GEO_DISTANCE VIOLATED", v['geometries'][0], v['geometries'][1])
                 if k == "sameAsNode":
                     first = self.GetValueFromPath(v[0])
                     second = self.GetValueFromPath(v[1])
@@ -275,7 +347,7 @@ class TemplateParserV1:
 
     def GenerateFakes(self):
         """Function that will generate fake values for unconstrained things"""
-        faker = AttrFaker(self.lat, self.lon, self.seed)
+        faker = AttrFaker(self.lat, self.lon, self.seed, self.rngs["fakes"], self.geocoder, self.metrics)
         for i in self.template["templateComponents"]:
             things = [i['hydratedThingSpec']['rootThing']] + i['hydratedThingSpec']['thingPropertyConstraints']
             for j in things:
@@ -285,34 +357,57 @@ class TemplateParserV1:
 
     def GenerateRDF(self, trim = False):
         """Function to generate triples list from template"""
+        triples = list(self.IterRDF(trim))
+        self.rdf += triples
+        self.metrics.Count('triples', len(triples))
+        return self
+
+    def IterRDF(self, trim = False):
+        """Function that yields the triples of the template one at a time, things without attributes are yielded last"""
+        rdftype = '<' + schema_grapher.util.RDFTYPE + '>'
         components = self.template["templateComponents"]
         if self.partial != None:
             if self.partial["MODE"] == "COMPONENT":
-                components = random.sample(components, int(len(components) * self.partial["PERCENT"]/100))
+                components = [components[k] for k in self.rngs["partial"].permutation(len(components))[:int(len(components) * self.partial["PERCENT"]/100)]]
         for i in components:
             empty = []
             i['hydratedThingSpec']['rootThing']['attributes'] += [[j["pathFromRoot"], j["value"], "object"] for j in i['hydratedThingSpec']['thingPropertyConstraints'] if '.' not in j['pathFromRoot']]
             things = [i['hydratedThingSpec']['rootThing']] + i['hydratedThingSpec']['thingPropertyConstraints']
             if self.partial != None:
                 if self.partial["MODE"] == "NODE":
-                    things = random.sample(things, int(len(things) * self.partial["PERCENT"]/100))
+                    things = [things[k] for k in self.rngs["partial"].permutation(len(things))[:int(len(things) * self.partial["PERCENT"]/100)]]
             for j in things:
                 j['attributes'] += [[k["pathFromRoot"].split('.')[-1], k["value"], "object"] for k in i['hydratedThingSpec']['thingPropertyConstraints'] if 'pathFromRoot' in j.keys() and '.'.join(k['pathFromRoot'].split('.')[0:-1]) == j['pathFromRoot']]
-                dedup = set(tuple(tuple(y) if type(y) is list else y for y in x) for x in j["attributes"])
+                dedup = dict.fromkeys(tuple(tuple(y) if type(y) is list else y for y in x) for x in j["attributes"])
                 if len(dedup) > 0:
-                    self.rdf += [(schema_grapher.util.WrapNS(j["value"]), '<' + schema_grapher.util.RDFTYPE + '>', schema_grapher.util.WrapNS(j["dataSchemaClass"]))]
-                    self.rdf += [(schema_grapher.util.WrapNS(j["value"]), schema_grapher.util.WrapNS("metaData"), schema_grapher.util.ParseDatum("metaData", json.dumps({"answerKey" : str(self.originSource) + '|' + ".".join([i["alias"],"root"] + ([j["pathFromRoot"]] if "pathFromRoot" in j.keys() else []))}), self.pt))]
+                    subject = schema_grapher.util.WrapNS(j["value"])
+                    yield (subject, rdftype, self.terms.IRI(j["dataSchemaClass"]))
+                    yield (subject, self.terms.IRI("metaData"), schema_grapher.util.ParseDatum("metaData", json.dumps({"answerKey" : str(self.originSource) + '|' + ".".join([i["alias"],"root"] + ([j["pathFromRoot"]] if "pathFromRoot" in j.keys() else []))}), self.pt))
                     for k in dedup:
                         if k[2] == 'object':
-                            self.rdf += [(schema_grapher.util.WrapNS(j["value"]), schema_grapher.util.WrapNS(k[0]), schema_grapher.util.WrapNS(k[1]))]
+                            yield (subject, self.terms.IRI(k[0]), schema_grapher.util.WrapNS(k[1]))
                         elif k[2] == 'geojson':
-                            self.rdf += [(schema_grapher.util.WrapNS(j["value"]), schema_grapher.util.WrapNS(k[0]), schema_grapher.util.ParseDatum(k[0], {"type": "Point", "coordinates": [float(k[1][1]), float(k[1][0])]}, self.pt))]
+                            yield (subject, self.terms.IRI(k[0]), self.terms.Point(k[0], k[1]))
                         else:
-                            self.rdf += [(schema_grapher.util.WrapNS(j["value"]), schema_grapher.util.WrapNS(k[0]), schema_grapher.util.ParseDatum(k[0], k[1], self.pt))]
+                            yield (subject, self.terms.IRI(k[0]), self.terms.Datum(k[0], k[1]))
                 elif not trim:
                     empty += [(schema_grapher.util.WrapNS(j["value"]), '<' + schema_grapher.util.RDFTYPE + '>', schema_grapher.util.WrapNS(j["dataSchemaClass"]))]
                     empty += [(schema_grapher.util.WrapNS(j["value"]), schema_grapher.util.WrapNS("metaData"), schema_grapher.util.ParseDatum("metaData", json.dumps({"answerKey" : str(self.originSource) + '|' + ".".join([i["alias"],"root"] + ([j["pathFromRoot"]] if "pathFromRoot" in j.keys() else []))}), self.pt))]
-            self.rdf += empty
+            yield from empty
+
+    def StreamTriples(self, fwrite, trim = False, compress = None, flushsize = FLUSH_SIZE):
+        """Function to generate the triples of the template and write them to a file as they are produced instead of keeping them in memory"""
+        with self.metrics.Stage('StreamTriples'):
+            with TripleWriter(fwrite, compress, flushsize) as writer:
+                writer.WriteAll(self.IterRDF(trim))
+        self.metrics.Count('triples', writer.count)
+        return self
+
+    def WriteSignal(self, writer, name, trim = False):
+        """Function to generate the triples of the template and append them to a ShardedWriter as one signal"""
+        with self.metrics.Stage('WriteSignal'):
+            entry = writer.WriteSignal(name, self.originSource, self.IterRDF(trim), self.signalSource)
+        self.metrics.Count('triples', entry['triples'])
         return self
 
     def WriteTemplate(self, fwrite):
@@ -323,6 +418,7 @@ class TemplateParserV1:
     
     def WriteTriples(self, fwrite):
         """Function to write out n-triples to a file"""
-        with open(fwrite, 'w') as f:
-            f.write(schema_grapher.util.RenderTriples(self.rdf))
+        with self.metrics.Stage('WriteTriples'):
+            with open(fwrite, 'w') as f:
+                f.write(schema_grapher.util.RenderTriples(self.rdf))
         return self
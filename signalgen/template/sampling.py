@@ -0,0 +1,132 @@
+import math
+import numpy as np
+
+RANGE_CONDITIONS = {
+    "LESS_THAN": "LESS_THAN", "lessThan": "LESS_THAN",
+    "LESS_THAN_OR_EQUAL": "LESS_THAN_OR_EQUAL", "lessThanOrEquals": "LESS_THAN_OR_EQUAL",
+    "GREATER_THAN": "GREATER_THAN", "greaterThan": "GREATER_THAN",
+    "GREATER_THAN_OR_EQUAL": "GREATER_THAN_OR_EQUAL", "greaterThanOrEquals": "GREATER_THAN_OR_EQUAL"
+}
+
+def ToFloat(val):
+    """Function to convert a value to a float, returns None if it can not be converted"""
+    try:
+        return float(val)
+    except:
+        return None
+
+def DifficultyExponent(difficulty):
+    """Function to map a difficulty in [0, 1] to the exponent applied to value counts; 0 weights values by their counts, 0.5 weights all values equally and 1 weights them by their inverse counts so rare values come out"""
+    difficulty = 0.5 if difficulty is None else min(max(float(difficulty), 0.0), 1.0)
+    return round(1.0 - 2.0 * difficulty, 6)
+
+def DrawCumulative(cum, lo, hi, u):
+    """Function to draw positions in [lo, hi) from a cumulative weight array with a leading zero, given an array of uniform numbers in [0, 1)"""
+    targets = cum[lo] + u * (cum[hi] - cum[lo])
+    return np.clip(np.searchsorted(cum, targets, 'right') - 1, lo, hi - 1)
+
+class AttributeIndex:
+    """Class that indexes the value counts of one attribute for sampling; numeric values are kept sorted in numpy arrays so range constraints are answered by binary search, non-numeric values are kept apart, and cumulative weights for each difficulty are computed once so every draw is a binary search"""
+    MAX_POSTING_CUMS = 4096
+    def __init__(self, attrcount):
+        self.values = list(attrcount.keys())
+        self.counts = np.maximum(np.array(list(attrcount.values()), dtype=np.float64), 1.0)
+        numeric = []
+        other = []
+        for i, k in enumerate(self.values):
+            f = ToFloat(k)
+            if f is None:
+                other += [i]
+            elif not math.isnan(f):
+                numeric += [(f, i)]
+        numeric = sorted(numeric, key=lambda x: x[0])
+        self.numeric = np.array([i[0] for i in numeric], dtype=np.float64)
+        self.numericpos = np.array([i[1] for i in numeric], dtype=np.int64)
+        self.other = np.array(other, dtype=np.int64)
+        self.cums = {}
+        self.numericcums = {}
+        self.postingcums = {}
+
+    def Range(self, cond, condval):
+        """Function to find the slice [lo, hi) of the sorted numeric values that satisfies a range condition"""
+        cond = RANGE_CONDITIONS[cond]
+        condval = float(condval)
+        if cond == "LESS_THAN":
+            return 0, int(np.searchsorted(self.numeric, condval, 'left'))
+        elif cond == "LESS_THAN_OR_EQUAL":
+            return 0, int(np.searchsorted(self.numeric, condval, 'right'))
+        elif cond == "GREATER_THAN":
+            return int(np.searchsorted(self.numeric, condval, 'right')), len(self.numeric)
+        return int(np.searchsorted(self.numeric, condval, 'left')), len(self.numeric)
+
+    def Cumulative(self, weights, exponent):
+        """Function to compute the cumulative distribution of counts raised to an exponent, with a leading zero"""
+        return np.concatenate([[0.0], np.cumsum(weights ** exponent)])
+
+    def Sample(self, u, difficulty=0.5):
+        """Function to draw len(u) values of the attribute for a difficulty given an array of uniform numbers in [0, 1)"""
+        exponent = DifficultyExponent(difficulty)
+        if exponent not in self.cums:
+            self.cums[exponent] = self.Cumulative(self.counts, exponent)
+        return [self.values[i] for i in DrawCumulative(self.cums[exponent], 0, len(self.values), u)]
+
+    def SampleRange(self, lo, hi, u, difficulty=0.5):
+        """Function to draw len(u) numeric values from the slice [lo, hi) for a difficulty given an array of uniform numbers in [0, 1)"""
+        exponent = DifficultyExponent(difficulty)
+        if exponent not in self.numericcums:
+            self.numericcums[exponent] = self.Cumulative(self.counts[self.numericpos], exponent)
+        return [self.values[self.numericpos[i]] for i in DrawCumulative(self.numericcums[exponent], lo, hi, u)]
+
+    def SamplePositions(self, positions, u, difficulty=0.5, key=None):
+        """Function to draw len(u) of the values at the given positions for a difficulty given an array of uniform numbers in [0, 1), the cumulative weights are kept under key when one is given"""
+        exponent = DifficultyExponent(difficulty)
+        cum = self.postingcums.get((key, exponent)) if key != None else None
+        if cum is None:
+            cum = self.Cumulative(self.counts[positions], exponent)
+            if key != None:
+                if len(self.postingcums) >= self.MAX_POSTING_CUMS:
+                    self.postingcums.clear()
+                self.postingcums[(key, exponent)] = cum
+        return [self.values[positions[i]] for i in DrawCumulative(cum, 0, len(positions), u)]
+
+class TokenIndex:
+    """Class that maps the space separated tokens of an attribute's string values to posting lists of positions in its AttributeIndex"""
+    def __init__(self, index=None):
+        self.tokens = {}
+        self.ptr = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int64)
+        if index != None:
+            postings = {}
+            for i, k in enumerate(index.values):
+                if type(k) is str:
+                    for token in set(k.split(" ")):
+                        if token not in postings:
+                            postings[token] = []
+                        postings[token] += [i]
+            self.tokens = {k: i for i, k in enumerate(postings.keys())}
+            self.ptr = np.concatenate([[0], np.cumsum([len(v) for v in postings.values()])]).astype(np.int64)
+            self.postings = np.array([i for v in postings.values() for i in v], dtype=np.int64)
+
+    def Lookup(self, token):
+        """Function to return the positions of the values that contain the token"""
+        i = self.tokens.get(token)
+        if i is None:
+            return self.postings[0:0]
+        return self.postings[self.ptr[i]:self.ptr[i + 1]]
+
+    def ToArrays(self):
+        """Function to convert the index to numpy arrays for storage"""
+        encoded = [k.encode('utf-8') for k in self.tokens.keys()]
+        tokenptr = np.concatenate([[0], np.cumsum([len(k) for k in encoded])]).astype(np.int64)
+        return {'tokens': np.frombuffer(b''.join(encoded), dtype=np.uint8), 'tokenptr': tokenptr, 'ptr': self.ptr, 'postings': self.postings}
+
+    @classmethod
+    def FromArrays(cls, arrays):
+        """Function to rebuild an index from arrays written by ToArrays"""
+        index = cls()
+        tokens = arrays['tokens'].tobytes()
+        tokenptr = arrays['tokenptr']
+        index.tokens = {tokens[tokenptr[i]:tokenptr[i + 1]].decode('utf-8'): i for i in range(len(tokenptr) - 1)}
+        index.ptr = arrays['ptr']
+        index.postings = arrays['postings']
+        return index
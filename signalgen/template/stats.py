@@ -1,21 +1,122 @@
+import os
 import json
-import urllib
+import time
+import hashlib
+import logging
+import threading
+import urllib.request
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from signalgen.template.metrics import *
+
+logger = logging.getLogger('signalgen_logger')
 
 RDFNS = 'http://schema.localhost/'
+STATS_BATCH_SIZE = 50
+STATS_CACHE_TTL = 7*24*60*60
+
+def BucketCounts(buckets):
+    """Function to convert the buckets of a propertyCounts response to a dictionary of value counts"""
+    if type(buckets) is dict:
+        return buckets
+    counts = {}
+    for i in buckets if buckets != None else []:
+        if type(i) is dict:
+            value = i['key'] if 'key' in i.keys() else i.get('value')
+            count = i['doc_count'] if 'doc_count' in i.keys() else i['docCount'] if 'docCount' in i.keys() else i.get('count', 1)
+        else:
+            value, count = i[0], i[1]
+        try:
+            counts[value] = counts.get(value, 0) + int(count)
+        except TypeError:
+            counts[json.dumps(value)] = counts.get(json.dumps(value), 0) + int(count)
+    return counts
+
+class StatsCache:
+    """Class that keeps stats endpoint responses as JSON files in a directory, entries older than the ttl in seconds are ignored"""
+    def __init__(self, path, ttl=STATS_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def Path(self, key):
+        """Function that returns the file of a cache key"""
+        return os.path.join(self.path, hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest() + '.json')
+
+    def Get(self, key):
+        """Function that returns the cached counts of a key, or None if they are missing or expired"""
+        try:
+            with open(self.Path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.ttl != None and time.time() - entry['time'] > self.ttl:
+            return None
+        return entry['counts']
+
+    def Set(self, key, counts):
+        """Function that stores the counts of a key, the file is written under a temporary name and moved into place so readers never see it half written"""
+        fpath = self.Path(key)
+        tmp = fpath + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'key': key, 'time': time.time(), 'counts': [[k, v] for k,v in counts.items()]}, f)
+            os.replace(tmp, fpath)
+        except (OSError, TypeError, ValueError) as e:
+            logger.debug('Could not cache stats for ' + str(key) + ': ' + str(e))
+        return self
+
 class Stats(dict):
     """Class that inherits from the dictionary class and mimics structure of attribute count dictionary; uses stats endpoint to lazy fill out the dictionary as queries are made to dictionary"""
-    def __init__(self, schema, qapi = 'http://api.localhost/query-dev/'):
+    def __init__(self, schema, qapi = 'http://api.localhost/query-dev/', size=1000, cachedir=None, ttl=STATS_CACHE_TTL, batchsize=STATS_BATCH_SIZE, timeout=(5, 60), retries=3, pool_maxsize=10):
         self.qapi = qapi
+        self.size = size
+        self.batchsize = max(1, int(batchsize))
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_maxsize = pool_maxsize
+        self.cache = StatsCache(cachedir, ttl) if cachedir != None else None
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.session = None
+        self.metrics = Metrics()
         super().__init__()
         self.PropertyType(schema)
 
+    def __reduce__(self):
+        return (self.__class__.__new__, (self.__class__,), self.__getstate__())
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        del state['session']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.session = None
+
+    def Session(self):
+        """Function that returns the keep-alive session used for stats requests, retrying failed connections and server errors with backoff"""
+        if self.session == None:
+            retry = Retry(total=self.retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.session = session
+        return self.session
+
     def PropertyType(self, schema_jsonld):
         """Function used to determine the type of an schema attribute"""
         pt = {}
         schema = None
         if 'http://' in schema_jsonld:
             try:
-                qr = urllib.request.urlopen(schema_jsonld)
+                qr = urllib.request.urlopen(schema_jsonld, timeout=self.timeout[1] if type(self.timeout) is tuple else self.timeout)
                 schema = json.loads(qr.read().decode())
             except Exception as e:
                 logger.error("Could not retrieve schema from external server", exc_info=e)
@@ -26,74 +127,114 @@ class Stats(dict):
             pt = {i['@id'].replace(RDFNS, '') : i[RDFNS + 'domainIncludes']['@id'].replace(RDFNS, '') for i in schema['@graph'] if RDFNS + 'rangeIncludes' in i.keys()}
         self.pt = pt
 
-    def qapiPropertyCounts(self, prop, size=1000):
-        """Function to query the stats endpoint for the attribute counts, by default returns the 1000 most frequent attributes"""
-        ntype = self.pt[prop]
+    def CacheKey(self, prop):
+        """Function that returns the disk cache key of a property"""
+        return [self.qapi, self.pt[prop], prop, self.size]
+
+    def qapiPropertyCounts(self, props, size=None):
+        """Function to query the stats endpoint for the attribute counts of a batch of properties in one request, by default returns the 1000 most frequent values of each"""
+        size = self.size if size == None else size
+        if type(props) is str:
+            props = [props]
         post = {
             "nodeProperties" : [
                 {
-                    "nodeType" : ntype, "propertyName" : prop
-                }
+                    "nodeType" : self.pt[prop], "propertyName" : prop
+                } for prop in props
             ]
         }
-        data = json.dumps(post).encode('utf-8')
-        req =  urllib.request.Request(self.qapi + 'stats/propertyCounts?size=' + size, data=data) # this will make the method "POST"
-        req.add_header('Content-Type', 'application/json; charset=utf-8')
-        resp = urllib.request.urlopen(req)
-        respdata = json.load(resp)
-        self.__dict__[prop] = respdata['propertyBuckets'][0]['buckets']
+        self.metrics.Count('stats_requests')
+        self.metrics.Count('stats_properties', len(props))
+        with self.metrics.Stage('qapiPropertyCounts'):
+            resp = self.Session().post(self.qapi + 'stats/propertyCounts', params={'size': str(size)}, json=post, timeout=self.timeout)
+        resp.raise_for_status()
+        respdata = resp.json()
+        buckets = respdata['propertyBuckets'] if 'propertyBuckets' in respdata.keys() else []
+        named = {i['propertyName']: i for i in buckets if type(i) is dict and 'propertyName' in i.keys()}
+        counts = {}
+        for j,prop in enumerate(props):
+            bucket = named[prop] if prop in named.keys() else buckets[j] if len(named) == 0 and j < len(buckets) else {}
+            counts[prop] = BucketCounts(bucket['buckets'] if 'buckets' in bucket.keys() else [])
+        return counts
+
+    def Prefetch(self, props, strict=False):
+        """Function to fill in the counts of properties that are not loaded yet, from the disk cache when possible and otherwise from the stats endpoint in batches, the properties of a failed batch are left out so a later access retries them and the error is raised when strict"""
+        missing = [i for i in dict.fromkeys(props) if i not in self.counts.keys() and i in self.pt.keys()]
+        fetch = []
+        for prop in missing:
+            cached = self.cache.Get(self.CacheKey(prop)) if self.cache != None else None
+            if cached != None:
+                self.metrics.Count('stats_cache_hits')
+                with self.lock:
+                    self.counts[prop] = {k: v for k,v in cached}
+            else:
+                fetch += [prop]
+        for i in range(0, len(fetch), self.batchsize):
+            batch = fetch[i:i + self.batchsize]
+            try:
+                counts = self.qapiPropertyCounts(batch)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                logger.error("Could not retrieve property counts for " + ', '.join(batch), exc_info=e)
+                self.metrics.Count('stats_errors')
+                if strict:
+                    raise
+                continue
+            for prop, v in counts.items():
+                if self.cache != None:
+                    self.cache.Set(self.CacheKey(prop), v)
+                with self.lock:
+                    self.counts[prop] = v
         return self
 
     #The following is boilerplate code for a dictionary with the exception of getitem which calls the stats endpoint if a key isn't in it's dictionary
     def __setitem__(self, key, item):
-        self.__dict__[key] = item
+        self.counts[key] = item
 
     def __getitem__(self, key):
-        if key not in self.__dict__.keys():
-            self.qapiPropertyCounts(key)
-        return self.__dict__[key]
+        if key not in self.counts.keys():
+            if key not in self.pt.keys():
+                raise KeyError(key)
+            self.Prefetch([key], True)
+        return self.counts[key]
 
     def __repr__(self):
-        return repr(self.__dict__)
+        return repr(self.counts)
 
     def __len__(self):
-        return len(self.__dict__)
+        return len(self.counts)
 
     def __delitem__(self, key):
-        del self.__dict__[key]
+        del self.counts[key]
 
     def clear(self):
-        return self.__dict__.clear()
+        return self.counts.clear()
 
     def copy(self):
-        return self.__dict__.copy()
+        return self.counts.copy()
 
     def has_key(self, k):
-        return k in self.__dict__
+        return k in self
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
 
     def update(self, *args, **kwargs):
-        return self.__dict__.update(*args, **kwargs)
+        return self.counts.update(*args, **kwargs)
 
     def keys(self):
-        return self.__dict__.keys()
+        return self.counts.keys()
 
     def values(self):
-        return self.__dict__.values()
+        return self.counts.values()
 
     def items(self):
-        return self.__dict__.items()
+        return self.counts.items()
 
     def pop(self, *args):
-        return self.__dict__.pop(*args)
-
-    def __cmp__(self, dict_):
-        return self.__cmp__(self.__dict__, dict_)
+        return self.counts.pop(*args)
 
     def __contains__(self, item):
-        return item in self.__dict__
+        return item in self.counts or item in self.pt
 
     def __iter__(self):
-        return iter(self.__dict__)
-
-    def __unicode__(self):
-        return unicode(repr(self.__dict__))
+        return iter(self.counts)
@@ -0,0 +1,66 @@
+import threading
+import schema_grapher
+from collections import OrderedDict
+
+TERM_CACHE_SIZE = 65536
+
+class TermCache:
+    """Class that memoizes rendered RDF terms for one set of property types, keyed by the kind of term, the attribute and the value and bounded by evicting the least recently used term"""
+    def __init__(self, pt, maxsize=TERM_CACHE_SIZE):
+        self.pt = pt
+        self.maxsize = max(1, int(maxsize))
+        self.terms = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def Lookup(self, key, render):
+        """Function that returns the cached term for a key, rendering and caching it with render() on a miss"""
+        with self.lock:
+            if key in self.terms:
+                self.terms.move_to_end(key)
+                self.hits += 1
+                return self.terms[key]
+        term = render()
+        with self.lock:
+            self.misses += 1
+            self.terms[key] = term
+            if len(self.terms) > self.maxsize:
+                self.terms.popitem(last=False)
+                self.evictions += 1
+        return term
+
+    def IRI(self, name):
+        """Function that returns the IRI of a schema name such as a class or predicate"""
+        return self.Lookup(('iri', name), lambda: schema_grapher.util.WrapNS(name))
+
+    def Datum(self, attr, value):
+        """Function that returns the literal of an attribute value, the key holds the repr of the value as well because equal values such as datetimes for one instant in different timezones or 0.0 and -0.0 render differently, values that can not be hashed are rendered without the cache"""
+        try:
+            return self.Lookup(('datum', attr, type(value), value, repr(value)), lambda: schema_grapher.util.ParseDatum(attr, value, self.pt))
+        except TypeError:
+            return schema_grapher.util.ParseDatum(attr, value, self.pt)
+
+    def Point(self, attr, latlon):
+        """Function that returns the GeoJSON point literal of an attribute given a latitude and longitude"""
+        lat = float(latlon[0])
+        lon = float(latlon[1])
+        return self.Lookup(('geojson', attr, lat, lon), lambda: schema_grapher.util.ParseDatum(attr, {"type": "Point", "coordinates": [lon, lat]}, self.pt))
+
+    def HitRate(self):
+        """Function that returns the share of lookups answered from the cache"""
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0.0
+
+    def Stats(self):
+        """Function that returns the cache counters so the size can be tuned"""
+        return {'size': len(self.terms), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.HitRate()}
@@ -14,19 +14,84 @@ import numpy as np
 import geopy.distance
 import datetime
 import hashlib
+import heapq
+import inspect
 import logging
 from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from faker import Faker
 
+from signalgen.template.world import *
+from signalgen.template.sampling import *
+from signalgen.template.ir import *
+from signalgen.template.output import *
+from signalgen.template.terms import *
+from signalgen.template.geocode import *
+from signalgen.template.metrics import *
+
 baseURI = 'http://schema.localhost/'
+EARTH_RADIUS = 6371008.8
+GEO_CANDIDATES = 256
+GEO_MAX_ROUNDS = 1000
+GEO_SCREEN_TOLERANCE = 0.005
+PREFETCH_THREADS = 8
+FAKER_POOL_SIZE = 256
+FAKER_VOCABULARIES = {}
 
 def SigDig(num):
     """Function that rounds a number  to it's most significt digit"""
     return round(num, -int(math.floor(math.log10(abs(num)))))
 
-def RanString():
+def RandomStreams(seed, names):
+    """Function to derive an independent, reproducible numpy generator for each named stage from a seed (or a spawned SeedSequence), returns the generators and the SeedSequence"""
+    if not isinstance(seed, np.random.SeedSequence):
+        try:
+            seed = np.random.SeedSequence(abs(int(seed)))
+        except (TypeError, ValueError):
+            seed = np.random.SeedSequence(int(hashlib.md5(str(seed).encode("utf-8")).hexdigest(), 16))
+    return {k: np.random.default_rng(v) for k, v in zip(names, seed.spawn(len(names)))}, seed
+
+class ThingIds:
+    """Class that derives the UUIDs of things from the signal's originSource, a stable path to the thing and a counter for repeated paths, so ids are the same across runs and workers"""
+    def __init__(self, originSource):
+        self.prefix = hashlib.blake2b(originSource.encode("utf-8"), digest_size=16)
+        self.counts = {}
+
+    def Id(self, path):
+        """Function that returns the next UUID of a path"""
+        count = self.counts.get(path, 0)
+        self.counts[path] = count + 1
+        h = self.prefix.copy()
+        h.update(("\x1f" + path + "\x1f" + str(count)).encode("utf-8"))
+        return str(uuid.UUID(bytes=h.digest()))
+
+    def Sub(self, name):
+        """Function that returns the ids of a namespace nested in this one, such as a subtemplate, so its ids never collide with this one's or a sibling's"""
+        ids = ThingIds("")
+        ids.prefix = self.prefix.copy()
+        ids.prefix.update(("\x1e" + name).encode("utf-8"))
+        return ids
+
+def AcceptsRng(fn):
+    """Function to check if an attribute generator takes the random generator as a fifth argument, generators written for the (attr, cond, condval, difficulty) contract do not"""
+    try:
+        params = list(inspect.signature(fn).parameters.values())
+    except (TypeError, ValueError):
+        return True
+    if any([i.kind == i.VAR_POSITIONAL for i in params]):
+        return True
+    return len([i for i in params if i.kind in [i.POSITIONAL_ONLY, i.POSITIONAL_OR_KEYWORD]]) >= 5
+
+def Uniform(a, b, rng=None):
+    """Function to draw a uniform float between a and b from rng, or from the global random state when no generator is given"""
+    return random.uniform(a, b) if rng is None else float(rng.uniform(a, b))
+
+def RanString(rng=None):
     """Function to generate a random string of 32 characters"""
-    return ''.join([random.choice(string.ascii_letters + string.digits) for n in range(32)])
+    chars = string.ascii_letters + string.digits
+    if rng is not None:
+        return ''.join([chars[n] for n in rng.integers(0, len(chars), 32)])
+    return ''.join([random.choice(chars) for n in range(32)])
 
 def DictIndex(varDict, var, value):
     """Finds the index of a value in a dictionary"""
@@ -36,122 +101,203 @@ def AttrIndex(varArr, value):
     """Returns the index of a list of lists where the first element of the inner list is the value"""
     return next((i for i in range(len(varArr)) if varArr[i][0] == value), None)
 
-def RandLatLon(y0,x0,distance):
-    """Returns a random latitude and longitude some distance away from a given latitude and longitude"""
-    r = distance/ 111300
-    u = np.random.uniform(0,1)
-    v = np.random.uniform(0,1)
+def RandLatLonBatch(y0,x0,distance,size=1,rng=None):
+    """Returns arrays of size random latitudes and longitudes within some distance in meters of one or many given latitudes and longitudes, the arrays have the broadcast shape of the centers with a trailing axis of length size, meters are converted to degrees with the WGS84 lengths of a degree at the center's latitude"""
+    rng = np.random if rng is None else rng
+    y0 = np.asarray(y0, dtype=np.float64)[..., None]
+    x0 = np.asarray(x0, dtype=np.float64)[..., None]
+    r = np.asarray(distance, dtype=np.float64)[..., None]
+    shape = np.broadcast(y0, x0, r).shape[:-1] + (size,)
+    u = rng.uniform(0,1,shape)
+    v = rng.uniform(0,1,shape)
     w = r * np.sqrt(u)
     t = 2 * np.pi * v
-    x = w * np.cos(t)
-    x1 = x / np.cos(y0)
-    y = w * np.sin(t)
-    return [y0 +y, x0+x1]
-
-def GenerateDynGeo(edges,locs,tbg):
-    """An algorithm that places geolocations at locations that satisfy the constraints of the graph"""
-    locsgen = [i[0] for i in locs]
-    subedges = [i for i in edges if (i[0] == tbg or i[1] == tbg) and (i[0] in locsgen or i[1] in locsgen)]
-    loc = locs[locsgen.index(subedges[0][0])] if subedges[0][0] != tbg else locs[locsgen.index(subedges[0][1])]
-    condis = subedges[0][2]
-    nloc = None
-    sat = False
-    while(not(sat)):
-        sat = True
-        nloc = RandLatLon(loc[1][0], loc[1][1], condis)
-        for i in subedges:
-            if i[0] == tbg:
-                sat = True if sat == True and geopy.distance.geodesic(locs[locsgen.index(i[1])][1],nloc).meters < i[2] else False
-            else:
-                sat = True if sat == True and geopy.distance.geodesic(locs[locsgen.index(i[0])][1],nloc).meters < i[2] else False
+    lat = np.radians(y0)
+    x = w * np.cos(t) / (111412.84 * np.cos(lat) - 93.5 * np.cos(3 * lat))
+    y = w * np.sin(t) / (111132.92 - 559.82 * np.cos(2 * lat) + 1.175 * np.cos(4 * lat))
+    return y0 + y, x0 + x
 
-    locs += [[tbg,nloc]]
-    
-    locsgen = [i[0] for i in locs]
-    nongen = sorted([i for i in edges if (i[0] in locsgen and i[1] not in locsgen) or (i[0] not in locsgen and i[1] in locsgen)], key = lambda x: x[2])
-    if len(nongen) > 0:
-        return GenerateDynGeo(edges,locs, nongen[0][0] if nongen[0][0] not in locsgen else nongen[0][1])
-    else:
-        disgen = [i for i in edges if (i[0] not in locsgen and i[1] not in locsgen)]
-        if len(disgen) > 0:
-            dtbg = disgen[0][1]
-            locs += [[disgen[0][0],locs[0][1]]]
-            return GenerateDynGeo(edges, locs, dtbg)
+def RandLatLon(y0,x0,distance,rng=None):
+    """Returns a random latitude and longitude some distance away from a given latitude and longitude"""
+    lats, lons = RandLatLonBatch(y0, x0, distance, 1, rng)
+    return [float(lats[0]), float(lons[0])]
+
+class LatLonPool:
+    """Class that hands out random latitudes and longitudes within some distance of a center, the points are drawn in batches"""
+    def __init__(self, y0, x0, distance, rng=None, size=64):
+        self.y0 = y0
+        self.x0 = x0
+        self.distance = distance
+        self.rng = rng
+        self.size = size
+        self.points = []
+
+    def Next(self):
+        """Function that returns the next point, drawing another batch when the pool is empty"""
+        if len(self.points) == 0:
+            lats, lons = RandLatLonBatch(self.y0, self.x0, self.distance, self.size, self.rng)
+            self.points = [[float(y), float(x)] for y, x in zip(lats[::-1], lons[::-1])]
+        return self.points.pop()
+
+def HaversineMeters(lat1, lon1, lat2, lon2):
+    """Function to compute great circle distances in meters between arrays of latitudes and longitudes"""
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(i, dtype=np.float64)) for i in [lat1, lon1, lat2, lon2]]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+def PlaceGeo(center, distance, neighbors, rng=None, size=GEO_CANDIDATES, max_rounds=GEO_MAX_ROUNDS, metrics=None):
+    """Function that proposes batches of points within distance of center and returns the first one closer than the limit to every placed neighbor given as [[lat, lon], limit], distances are screened with a vectorized great circle distance and the chosen point is confirmed with geodesic distances"""
+    nlat = np.array([float(i[0][0]) for i in neighbors])
+    nlon = np.array([float(i[0][1]) for i in neighbors])
+    limits = np.array([float(i[1]) for i in neighbors])
+    for k in range(max_rounds):
+        lats, lons = RandLatLonBatch(center[0], center[1], distance, size, rng)
+        screened = np.all(HaversineMeters(lats[:, None], lons[:, None], nlat[None, :], nlon[None, :]) < limits[None, :] * (1 + GEO_SCREEN_TOLERANCE), axis=1)
+        if metrics != None:
+            metrics.Count('geo_rounds')
+        for j in np.flatnonzero(screened):
+            if metrics != None:
+                metrics.Count('geo_geodesic_checks')
+            nloc = [float(lats[j]), float(lons[j])]
+            if all(geopy.distance.geodesic(i[0], nloc).meters < i[1] for i in neighbors):
+                return nloc
+    raise ValueError("Could not place a location within " + str(distance) + " meters of " + str(center) + " that satisfies " + str(len(neighbors)) + " GEO_DISTANCE constraints after " + str(max_rounds * size) + " proposals")
+
+def GenerateDynGeo(edges,locs,tbg,rng=None,metrics=None):
+    """An algorithm that places geolocations at locations that satisfy the constraints of the graph, the next location placed is the one across the shortest edge from the placed locations and its candidates are checked against all of its placed neighbors at once"""
+    placed = {i[0]:i[1] for i in locs}
+    incident = {}
+    for j,i in enumerate(edges):
+        for k in dict.fromkeys(i[0:2]):
+            if k not in incident.keys():
+                incident[k] = []
+            incident[k] += [j]
+    frontier = []
+    for k in list(placed.keys()):
+        for j in incident[k] if k in incident.keys() else []:
+            heapq.heappush(frontier, (edges[j][2], j))
+    unvisited = 0
+    while tbg != None:
+        subedges = [edges[j] for j in incident[tbg] if (edges[j][0] in placed.keys() or edges[j][1] in placed.keys()) and (edges[j][0] != tbg or edges[j][1] != tbg)]
+        loc = placed[subedges[0][0]] if subedges[0][0] != tbg else placed[subedges[0][1]]
+        nloc = PlaceGeo(loc, subedges[0][2], [[placed[i[1]] if i[0] == tbg else placed[i[0]], i[2]] for i in subedges], rng, metrics=metrics)
+        if metrics != None:
+            metrics.Count('geo_placements')
+        locs += [[tbg,nloc]]
+        placed[tbg] = nloc
+        for j in incident[tbg]:
+            heapq.heappush(frontier, (edges[j][2], j))
+        tbg = None
+        while len(frontier) > 0 and tbg == None:
+            j = heapq.heappop(frontier)[1]
+            if (edges[j][0] in placed.keys()) != (edges[j][1] in placed.keys()):
+                heapq.heappush(frontier, (edges[j][2], j))
+                tbg = edges[j][0] if edges[j][0] not in placed.keys() else edges[j][1]
+        while tbg == None and unvisited < len(edges):
+            if edges[unvisited][0] not in placed.keys() and edges[unvisited][1] not in placed.keys() and edges[unvisited][0] != edges[unvisited][1]:
+                tbg = edges[unvisited][1]
+                locs += [[edges[unvisited][0],locs[0][1]]]
+                placed[edges[unvisited][0]] = locs[0][1]
+                for j in incident[edges[unvisited][0]]:
+                    heapq.heappush(frontier, (edges[j][2], j))
+            unvisited += 1
     return locs
 
-def GenerateDynDiff(edges, tms, tbg):
-    """An algorithm that determines integers that satisfy the constraints of the graph"""
-    tmsgen = [i[0] for i in tms]
-    subedges = [i for i in edges if (i[0] == tbg or i[1] == tbg) and (i[0] in tmsgen or i[1] in tmsgen)]
-    invcond = False
-    if subedges[0][0] == tbg:
-        tm = tms[tmsgen.index(subedges[0][1])]
-    else:
-        tm = tms[tmsgen.index(subedges[0][0])]
-        invcond = not invcond
-    condis = subedges[0][2]
-    ntm = None
-    sat = False
-    while(not(sat)):
-        sat = True
-        ntm = 0 if condis[0] == 0 else random.randint(condis[0],condis[1])
-        for i in subedges:
-            if i[0] == tbg:
-                otm = tms[tmsgen.index(i[1])][1]
-                sat = True if sat == True and otm+ntm >= otm+i[2][0] and otm+ntm <= otm+i[2][1] else False                
+def DifferenceBounds(nodes, edges):
+    """Function to compute the tightest bounds on the differences between nodes from edges [thing1, thing2, (minValue, maxValue)] meaning minValue <= thing1 - thing2 <= maxValue, entry [u][v] of the result bounds v - u from above, raises a ValueError if the constraints can not all be satisfied"""
+    pos = {k:i for i,k in enumerate(nodes)}
+    dist = np.full((len(nodes), len(nodes)), np.inf)
+    np.fill_diagonal(dist, 0.0)
+    for i in edges:
+        a = pos[i[0]]
+        b = pos[i[1]]
+        dist[b][a] = min(dist[b][a], float(i[2][1]))
+        dist[a][b] = min(dist[a][b], -float(i[2][0]))
+    for k in range(len(nodes)):
+        dist = np.minimum(dist, dist[:, k, None] + dist[None, k, :])
+        if dist[k][k] < 0:
+            break
+    bad = np.flatnonzero(np.diag(dist) < 0)
+    if len(bad) > 0:
+        raise ValueError("Difference constraints can not be satisfied, there is a contradictory cycle through " + str(nodes[bad[0]]))
+    return dist
+
+def SolveDifferenceConstraints(edges, fixed=None, rng=None, metrics=None):
+    """Function to assign integer offsets to the nodes of a graph of difference constraints, the feasible interval of every node is computed from shortest paths and each node is drawn uniformly from its interval given the nodes already placed, the first node of each connected component is placed at 0 unless it is fixed, draws come from rng or from the global random state when no generator is given, offsets are integers so the bounds are tightened to integers first and a ValueError is raised when no integer offsets satisfy the constraints"""
+    edges = [[i[0], i[1], (np.ceil(float(i[2][0])), np.floor(float(i[2][1])))] for i in edges]
+    fixed = {} if fixed == None else fixed
+    nodes = list(dict.fromkeys([k for i in edges for k in i[0:2]] + list(fixed.keys())))
+    neighbors = {k:[] for k in nodes}
+    for i in edges:
+        neighbors[i[0]] += [i[1]]
+        neighbors[i[1]] += [i[0]]
+    offsets = {}
+    seen = set()
+    for root in nodes:
+        if root in seen:
+            continue
+        component = [root]
+        seen.add(root)
+        for k in component:
+            for l in neighbors[k]:
+                if l not in seen:
+                    seen.add(l)
+                    component += [l]
+        members = set(component)
+        if metrics != None:
+            metrics.Count('diff_components')
+            metrics.Count('diff_nodes', len(component))
+        dist = DifferenceBounds(component, [i for i in edges if i[0] in members])
+        placed = [j for j,k in enumerate(component) if k in fixed.keys()]
+        values = np.zeros(len(component))
+        for j in placed:
+            values[j] = fixed[component[j]]
+        if len(placed) > 0:
+            lo = np.max(values[placed, None] - dist[:, placed].T, axis=0)
+            hi = np.min(values[placed, None] + dist[placed, :], axis=0)
+            if np.any(lo[placed] > values[placed]) or np.any(hi[placed] < values[placed]):
+                raise ValueError("Difference constraints can not be satisfied by the fixed values")
+        for j,k in enumerate(component):
+            if k in fixed.keys():
+                continue
+            if len(placed) == 0:
+                value = 0
             else:
-                otm = tms[tmsgen.index(i[0])][1]
-                sat = True if sat == True and otm-ntm <= otm-i[2][0] and otm-ntm >= otm-i[2][1] else False
-    tms += [[tbg, ntm+tm[1]]]
-
-    tmsgen = [i[0] for i in tms]
-    nongen = sorted([i for i in edges if (i[0] in tmsgen and i[1] not in tmsgen) or (i[0] not in tmsgen and i[1] in tmsgen)], key = lambda x: x[2])
-    if len(nongen) > 0:
-        return GenerateDynDiff(edges,tms, nongen[0][0] if nongen[0][0] not in tmsgen else nongen[0][1])
-    else:
-        disgen = [i for i in edges if (i[0] not in tmsgen and i[1] not in tmsgen)]
-        if len(disgen) > 0:
-            dtbg = disgen[0][1]
-            tms += [[disgen[0][0],tms[0][1]]]
-            return GenerateDynDiff(edges, tms, dtbg)
-    return tms
+                lo = np.max(values[placed] - dist[j, placed])
+                hi = np.min(values[placed] + dist[placed, j])
+                lo, hi = math.ceil(lo), math.floor(hi)
+                if lo > hi:
+                    raise ValueError("Difference constraints can not be satisfied by integer offsets, the interval of " + str(k) + " holds no integer")
+                value = random.randint(lo, hi) if rng is None else int(rng.integers(lo, hi, endpoint=True))
+            values[j] = value
+            placed += [j]
+        for j,k in enumerate(component):
+            offsets[k] = fixed[k] if k in fixed.keys() else int(values[j])
+    return offsets
+
+def GenerateDynDiff(edges, tms, tbg=None, rng=None, metrics=None):
+    """An algorithm that determines integers that satisfy the constraints of the graph, the nodes in tms keep their values and the rest are solved for with SolveDifferenceConstraints"""
+    offsets = SolveDifferenceConstraints(edges, {i[0]:i[1] for i in tms}, rng, metrics)
+    return [[k, v] for k,v in offsets.items()]
     
 class AttributeGen:
     """A class which provides methods of generating attribute values"""
     def __init__(self, wrldir, attrcounts = None, num_threads=1):
         self.attrcounts = {}
+        self.num_threads = num_threads
+        self.indexes = {}
+        self.tokens = {}
+        self.metrics = Metrics()
         if attrcounts != None:
             self.attrcounts = attrcounts
         else:
             self.ReadWorld(wrldir)
 
-    def ReadWorld(self, wrldir, exts = ['nt', 'gz']):
-        """Function to read the ntriples in a world graph directory and determine attribute counts"""
-        for i in os.listdir(wrldir):
-            fpath = os.path.join(wrldir, i)
-            fformat = i.split('.')[-1]
-            if os.path.isfile(fpath) and fformat in exts:
-                g = rdflib.Graph()
-                if fformat != 'gz':
-                    with open(fpath) as f:
-                        g.parse(f, format=fformat)
-                elif fformat == 'gz':
-                    with gzip.open(fpath) as f:
-                        g.parse(f, format=i.split('.')[-2])
-                for j in g:
-                    if type(j[2]) != rdflib.term.URIRef:
-                        attr = j[1].split(baseURI)[-1]
-                        attrval = j[2].toPython()
-                        try:
-                            attrval = float(attrval)
-                        except:
-                            attrval = attrval
-                        if attr not in self.attrcounts.keys():
-                            self.attrcounts[attr] = {}
-                        if attrval in self.attrcounts[attr].keys():
-                            self.attrcounts[attr][attrval] += 1
-                        else:
-                            self.attrcounts[attr][attrval] = 1
+    def ReadWorld(self, wrldir, exts = ['nt', 'gz'], stream = True, num_threads = None, chunksize = 64*1024*1024):
+        """Function to read the ntriples in a world graph directory and determine attribute counts, n-triples files are streamed line by line unless stream is False and are counted by num_threads worker processes"""
+        tasks = WorldTasks(wrldir, exts, stream, chunksize)
+        CountWorld(tasks, self.attrcounts, self.num_threads if num_threads is None else num_threads)
+        return self
 
     def CheckIterable(self, val):
         """Function to check if a variable is an iterable"""
@@ -169,61 +315,84 @@ class AttributeGen:
         except:
             return False
 
-    def GenerateAttribute(self, attr, cond, condval, difficulty=0.5): #difficulty is from 0 to 1 where 0 is easier
+    def Index(self, attr):
+        """Function to return the sampling index of an attribute, building it on first use"""
+        if attr not in self.indexes:
+            with self.metrics.Stage('Index'):
+                self.indexes[attr] = AttributeIndex(self.attrcounts[attr])
+        return self.indexes[attr]
+
+    def Tokens(self, attr):
+        """Function to return the token index of an attribute, it is read from or stored alongside the attribute counts when they support it and built on first use otherwise"""
+        if attr not in self.tokens:
+            with self.metrics.Stage('Tokens'):
+                arrays = self.attrcounts.ReadTokens(attr) if hasattr(self.attrcounts, 'ReadTokens') else None
+                if arrays != None:
+                    self.tokens[attr] = TokenIndex.FromArrays(arrays)
+                else:
+                    self.tokens[attr] = TokenIndex(self.Index(attr))
+                    if hasattr(self.attrcounts, 'WriteTokens'):
+                        self.attrcounts.WriteTokens(attr, self.tokens[attr].ToArrays())
+        return self.tokens[attr]
+
+    def Prefetch(self, attrs, num_threads=PREFETCH_THREADS):
+        """Function to load the counts and build the sampling indexes of attributes before generation, counts that come from the stats endpoint are fetched in batches and the loading is spread over a thread pool so the latency is paid in one phase up front"""
+        attrs = [i for i in dict.fromkeys(attrs) if i not in self.indexes and i in self.attrcounts]
+        if len(attrs) == 0:
+            return self
+        num_threads = max(1, min(int(num_threads), len(attrs)))
+        with self.metrics.Stage('Prefetch'), ThreadPool(num_threads) as pool:
+            if hasattr(self.attrcounts, 'Prefetch'):
+                batchsize = self.attrcounts.batchsize if hasattr(self.attrcounts, 'batchsize') else 1
+                pool.map(self.attrcounts.Prefetch, [attrs[i:i + batchsize] for i in range(0, len(attrs), batchsize)])
+            indexes = pool.map(lambda attr: AttributeIndex(self.attrcounts[attr]), attrs)
+        self.metrics.Count('prefetched_attributes', len(attrs))
+        for attr, index in zip(attrs, indexes):
+            self.indexes.setdefault(attr, index)
+        return self
+
+    def GenerateAttribute(self, attr, cond, condval, difficulty=0.5, rng=None): #difficulty is from 0 to 1 where 0 is easier
         """Function to generate an attribute value that satisfies the constraint"""
+        values = self.GenerateAttributes(attr, cond, condval, difficulty, 1, rng)
+        return values[0] if values != None else None
+
+    def GenerateAttributes(self, attr, cond, condval, difficulty=0.5, size=1, rng=None):
+        """Function to generate a batch of attribute values that satisfy the constraint; values taken from the world are common at low difficulty and rare at high difficulty"""
         if cond == "EQUALS" or cond == "equals":
-            return condval
-        elif cond == "ANY" or cond == "any":
-            candidates = [(k, v) for k, v in self.attrcounts[attr].items()] if attr in self.attrcounts.keys() else []
-            if len(candidates) > 0:
-                candidates = sorted(candidates, key=lambda x: x[1])
-                #idx = math.floor(len(candidates)*difficulty)
-                return random.choice(candidates)[0]
+            return [condval for i in range(size)]
+        index = self.Index(attr) if attr in self.attrcounts else None
+        if cond == "ANY" or cond == "any":
+            if index != None and len(index.values) > 0:
+                return index.Sample(self.Uniforms(size, rng), difficulty)
             else:
-                return RanString()
+                return [RanString(rng) for i in range(size)]
         elif cond == "STRING_CONTAINS" or cond == "stringLike":
-            candidates = [(k, v) for k, v in self.attrcounts[attr].items() if self.CheckIterable(k) and condval in k.split(" ")] if attr in self.attrcounts.keys() else []
-            if len(candidates) > 0:
-                candidates = sorted(candidates, key=lambda x: x[1])
-                #idx = math.floor(len(candidates)*difficulty)
-                return random.choice(candidates)[0]
-            else:
-                return RanString() + " " + condval + " " + RanString()
-        elif cond == "LESS_THAN" or cond == "lessThan":
-            candidates = [(k, v) for k, v in self.attrcounts[attr].items() if self.CheckFloat(k) and k < float(condval)] if attr in self.attrcounts.keys() else []
-            if len(candidates) > 0:
-                candidates = sorted(candidates, key=lambda x: x[1])
-                #idx = math.floor(len(candidates)*difficulty)
-                return random.choice(candidates)[0]
-            else:
-                return random.uniform(0, float(condval) - SigDig(float(condval)))
-        elif cond == "LESS_THAN_OR_EQUAL" or cond == "lessThanOrEquals":
-            candidates = [(k, v) for k, v in self.attrcounts[attr].items() if self.CheckFloat(k) and k <= float(condval)] if attr in self.attrcounts.keys() else []
-            if len(candidates) > 0:
-                candidates = sorted(candidates, key=lambda x: x[1])
-                #idx = math.floor(len(candidates)*difficulty)
-                return random.choice(candidates)[0]
+            positions = self.Tokens(attr).Lookup(condval) if index != None else []
+            if len(positions) > 0:
+                return index.SamplePositions(positions, self.Uniforms(size, rng), difficulty, condval)
             else:
-                return random.uniform(0, float(condval))
-        elif cond == "GREATER_THAN" or cond == "greaterThan":
-            candidates = [(k, v) for k, v in self.attrcounts[attr].items() if self.CheckFloat(k) and k > float(condval)] if attr in self.attrcounts.keys() else []
-            if len(candidates) > 0:
-                candidates = sorted(candidates, key=lambda x: x[1])
-                #idx = math.floor(len(candidates)*difficulty)
-                return random.choice(candidates)[0]
+                return [RanString(rng) + " " + condval + " " + RanString(rng) for i in range(size)]
+        elif cond in RANGE_CONDITIONS:
+            lo, hi = index.Range(cond, condval) if index != None else (0, 0)
+            if hi > lo:
+                return index.SampleRange(lo, hi, self.Uniforms(size, rng), difficulty)
+            elif RANGE_CONDITIONS[cond] == "LESS_THAN":
+                return [Uniform(0, float(condval) - SigDig(float(condval)), rng) for i in range(size)]
+            elif RANGE_CONDITIONS[cond] == "LESS_THAN_OR_EQUAL":
+                return [Uniform(0, float(condval), rng) for i in range(size)]
+            elif RANGE_CONDITIONS[cond] == "GREATER_THAN":
+                return [Uniform(float(condval) + SigDig(float(condval)), float(condval) + SigDig(float(condval))*2, rng) for i in range(size)]
             else:
-                return random.uniform(float(condval) + SigDig(float(condval)), float(condval) + SigDig(float(condval))*2)
-        elif cond == "GREATER_THAN_OR_EQUAL" or cond == "greaterThanOrEquals":
-            candidates = [(k, v) for k, v in self.attrcounts[attr].items() if self.CheckFloat(k) and k >= float(condval)] if attr in self.attrcounts.keys() else []
-            if len(candidates) > 0:
-                candidates = sorted(candidates, key=lambda x: x[1])
-                #idx = math.floor(len(candidates)*difficulty)
-                return random.choice(candidates)[0]
-            else:
-                return random.uniform(float(condval), float(condval) + SigDig(float(condval)))
+                return [Uniform(float(condval), float(condval) + SigDig(float(condval)), rng) for i in range(size)]
         else:
             return None
 
+    def Uniforms(self, size, rng=None):
+        """Function to draw an array of uniform numbers in [0, 1) for sampling"""
+        if rng is not None:
+            return rng.random(size)
+        return np.array([random.random() for i in range(size)])
+
 class TemplateMerger:
     """Template merger for use with templates in V0 template schema"""
     def __init__(self, t1, t2):
@@ -322,13 +491,63 @@ class TemplateMerger:
         return self       
 
     
+def FakerVocabulary(method):
+    """Function that returns the values and cumulative weights a Faker method such as last_name picks from, read once per process from the provider's value list, or None if the method does not pick from a list"""
+    if method not in FAKER_VOCABULARIES:
+        FAKER_VOCABULARIES[method] = None
+        for provider in Faker().providers:
+            elements = getattr(provider, method + 's', None)
+            if isinstance(elements, dict) and len(elements) > 0:
+                weights = np.array([float(i) for i in elements.values()])
+                FAKER_VOCABULARIES[method] = (list(elements.keys()), np.cumsum(weights / weights.sum()))
+                break
+            elif isinstance(elements, (list, tuple)) and len(elements) > 0:
+                FAKER_VOCABULARIES[method] = (list(elements), np.arange(1, len(elements) + 1) / len(elements))
+                break
+    return FAKER_VOCABULARIES[method]
+
+class FakerPool:
+    """Class that hands out fake values of Faker methods, the values are drawn in batches with the provider's weights from a random generator, methods that do not pick from a value list are called on one Faker seeded once per pool"""
+    def __init__(self, seed, rng=None, size=FAKER_POOL_SIZE):
+        self.seed = seed
+        self.rng = rng
+        self.size = size
+        self.fake = None
+        self.values = {}
+
+    def Fill(self, method):
+        """Function that draws the next batch of values of a method"""
+        vocabulary = FakerVocabulary(method)
+        if vocabulary != None:
+            u = self.rng.random(self.size) if self.rng is not None else np.array([random.random() for i in range(self.size)])
+            picks = np.minimum(np.searchsorted(vocabulary[1], u, side='right'), len(vocabulary[0]) - 1)
+            values = [vocabulary[0][i] for i in picks]
+        else:
+            if self.fake == None:
+                self.fake = Faker()
+                self.fake.seed_instance(self.seed)
+            values = [getattr(self.fake, method)() for i in range(self.size)]
+        self.values[method] = values[::-1]
+        return self
+
+    def Next(self, method):
+        """Function that returns the next value of a method, drawing another batch when its pool is empty"""
+        if method not in self.values or len(self.values[method]) == 0:
+            self.Fill(method)
+        return self.values[method].pop()
+
 class AttrFaker:
     """Class that generates fake attribute values for a subset of attributes"""
-    def __init__(self, lat, lon, seed):
+    def __init__(self, lat, lon, seed, rng=None, geocoder=None, metrics=None):
         self.hash_map = {}
         self.lat = float(lat)
         self.lon = float(lon)
         self.seed = seed
+        self.rng = RandomStreams(seed, ['fakes'])[0]['fakes'] if rng is None else rng
+        self.locations = LatLonPool(self.lat, self.lon, 10000, self.rng)
+        self.geocoder = DEFAULT_GEOCODER if geocoder == None else geocoder
+        self.names = FakerPool(seed, self.rng)
+        self.metrics = Metrics() if metrics == None else metrics
 
     def GenerateFakes(self, dataSchemaClass, curAttrs):
         """Function that attempts to generate a fake value"""
@@ -355,17 +574,16 @@ class AttrFaker:
 
     def PersonIdentifier(self):
         """Function to generate a fake person name"""
-        fake = Faker()
-        Faker.seed(self.seed)
-        return [['personIdentifierSurName', fake.last_name(), 'value'],
-                ['personIdentifierGivenName', fake.first_name(), 'value']
+        self.metrics.Count('person_names')
+        return [['personIdentifierSurName', self.names.Next('last_name'), 'value'],
+                ['personIdentifierGivenName', self.names.Next('first_name'), 'value']
                 ]
 
     def AddressLocation(self):
-        """Function to generate a fake address location, uses the nominatim service to find street address information"""
-        latlon = RandLatLon(self.lat, self.lon, 10000)
-        rlookup = schema_grapher.util.LatLonQuery(latlon[0], latlon[1])
-        qdict = rlookup[0]['features'][0]
+        """Function to generate a fake address location, uses the geocoder to find street address information"""
+        latlon = self.locations.Next()
+        with self.metrics.Stage('Geocode'):
+            qdict = self.geocoder.Reverse(latlon[0], latlon[1])
         keys = qdict['properties'].keys()
         if 'error' in keys:
             return []
@@ -0,0 +1,212 @@
+import os
+import re
+import gzip
+import datetime
+import decimal
+import rdflib
+from multiprocessing import Pool
+
+baseURI = 'http://schema.localhost/'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+NT_ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+NT_ECHARS = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+XSD_INTS = set(XSD + i for i in ['integer', 'int', 'long', 'short', 'byte', 'nonNegativeInteger', 'nonPositiveInteger', 'positiveInteger', 'negativeInteger', 'unsignedInt', 'unsignedLong', 'unsignedShort', 'unsignedByte'])
+XSD_FLOATS = set(XSD + i for i in ['double', 'float'])
+
+def UnescapeNT(lexical):
+    """Function to resolve the escape sequences of an n-triples literal"""
+    if '\\' not in lexical:
+        return lexical
+    return NT_ESCAPE.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)) if m.group(3) is None else NT_ECHARS.get(m.group(3), m.group(0)), lexical)
+
+def CastLiteral(lexical, datatype=None):
+    """Function to convert a literal to the python value rdflib would give for it, followed by the float conversion ReadWorld applies"""
+    try:
+        if datatype is None or datatype == XSD + 'string':
+            value = lexical
+        elif datatype in XSD_INTS:
+            value = int(lexical)
+        elif datatype in XSD_FLOATS or datatype == XSD + 'decimal':
+            value = float(decimal.Decimal(lexical)) if datatype == XSD + 'decimal' else float(lexical)
+        elif datatype == XSD + 'boolean':
+            value = lexical.strip().lower() in ('true', '1')
+        elif datatype == XSD + 'dateTime':
+            value = datetime.datetime.fromisoformat(lexical)
+        elif datatype == XSD + 'date':
+            value = datetime.date.fromisoformat(lexical)
+        elif datatype == XSD + 'time':
+            value = datetime.time.fromisoformat(lexical)
+        else:
+            value = lexical
+    except (ValueError, decimal.InvalidOperation):
+        value = lexical
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def ParseNTLine(line):
+    """Function to split an n-triples line into its predicate and literal value, returns None for comments, IRI objects and malformed lines"""
+    parts = line.split(None, 2)
+    if len(parts) < 3 or parts[0][0] == '#':
+        return None
+    obj = parts[2].rstrip()
+    if obj[-1:] != '.':
+        return None
+    obj = obj[:-1].rstrip()
+    if obj[:1] == '"':
+        end = obj.rfind('"')
+        if end < 1:
+            return None
+        suffix = obj[end + 1:]
+        datatype = suffix[3:-1] if suffix[:3] == '^^<' else None
+        value = CastLiteral(UnescapeNT(obj[1:end]), datatype)
+    elif obj[:2] == '_:':
+        value = obj[2:]
+    else:
+        return None
+    return parts[1][1:-1].split(baseURI)[-1], value
+
+def OpenWorldFile(fpath):
+    """Function to open a world graph file as text, transparently decompressing gzip files"""
+    if fpath.split('.')[-1] == 'gz':
+        return gzip.open(fpath, 'rt', encoding='utf-8')
+    return open(fpath, encoding='utf-8')
+
+def CountNTriples(lines, attrcounts=None):
+    """Function to count the literal values per predicate in an iterable of n-triples lines without building a graph"""
+    attrcounts = {} if attrcounts is None else attrcounts
+    for line in lines:
+        parsed = ParseNTLine(line)
+        if parsed is None:
+            continue
+        counts = attrcounts.get(parsed[0])
+        if counts is None:
+            counts = attrcounts[parsed[0]] = {}
+        counts[parsed[1]] = counts.get(parsed[1], 0) + 1
+    return attrcounts
+
+def CountWorldFile(fpath, attrcounts=None):
+    """Function to stream an n-triples world graph file (optionally gzipped) into attribute counts"""
+    with OpenWorldFile(fpath) as f:
+        return CountNTriples(f, attrcounts)
+
+def ReadRange(f, start, end):
+    """Generator over the decoded lines of a binary file that begin inside the byte range [start, end)"""
+    pos = start
+    f.seek(start)
+    if start > 0:
+        f.seek(start - 1)
+        pos = start - 1 + len(f.readline())
+    while pos < end:
+        line = f.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line.decode('utf-8')
+
+def CountWorldRange(fpath, start, end, attrcounts=None):
+    """Function to count the n-triples lines of an uncompressed file that begin inside the byte range [start, end)"""
+    with open(fpath, 'rb') as f:
+        return CountNTriples(ReadRange(f, start, end), attrcounts)
+
+def ParseWorldGraph(fpath, attrcounts=None):
+    """Function to count the literal values of a world graph file by loading it into an rdflib graph, used for formats the streaming scanner does not read"""
+    attrcounts = {} if attrcounts is None else attrcounts
+    fname = os.path.basename(fpath)
+    g = rdflib.Graph()
+    if fname.split('.')[-1] != 'gz':
+        with open(fpath) as f:
+            g.parse(f, format=fname.split('.')[-1])
+    else:
+        with gzip.open(fpath) as f:
+            g.parse(f, format=fname.split('.')[-2])
+    for j in g:
+        if type(j[2]) != rdflib.term.URIRef:
+            attr = j[1].split(baseURI)[-1]
+            attrval = j[2].toPython()
+            try:
+                attrval = float(attrval)
+            except:
+                attrval = attrval
+            if attr not in attrcounts.keys():
+                attrcounts[attr] = {}
+            if attrval in attrcounts[attr].keys():
+                attrcounts[attr][attrval] += 1
+            else:
+                attrcounts[attr][attrval] = 1
+    return attrcounts
+
+def WorldFiles(wrldir, exts=['nt', 'gz']):
+    """Function to list the world graph files of a directory with one of the given extensions"""
+    return [os.path.join(wrldir, i) for i in os.listdir(wrldir) if os.path.isfile(os.path.join(wrldir, i)) and i.split('.')[-1] in exts]
+
+def WorldTasks(wrldir, exts=['nt', 'gz'], stream=True, chunksize=64*1024*1024):
+    """Function to list the counting tasks of a world graph directory, large uncompressed n-triples files are split into byte ranges of chunksize"""
+    tasks = []
+    for fpath in WorldFiles(wrldir, exts):
+        i = os.path.basename(fpath)
+        fformat = i.split('.')[-1]
+        if stream and fformat == 'nt':
+            size = os.path.getsize(fpath)
+            step = max(chunksize if chunksize else size, 1)
+            for start in range(0, max(size, 1), step):
+                tasks += [(fpath, 'range', start, min(start + step, size))]
+        elif stream and fformat == 'gz' and i.split('.')[-2] == 'nt':
+            tasks += [(fpath, 'stream', None, None)]
+        else:
+            tasks += [(fpath, 'graph', None, None)]
+    return tasks
+
+def CountWorldTask(task, attrcounts=None):
+    """Function to run a single counting task produced by WorldTasks"""
+    if task[1] == 'range':
+        return CountWorldRange(task[0], task[2], task[3], attrcounts)
+    elif task[1] == 'stream':
+        return CountWorldFile(task[0], attrcounts)
+    return ParseWorldGraph(task[0], attrcounts)
+
+def MergeCounts(attrcounts, other):
+    """Function to add the attribute counts of other into attrcounts"""
+    for attr, counts in other.items():
+        mine = attrcounts.get(attr)
+        if mine is None:
+            attrcounts[attr] = counts
+            continue
+        for k, v in counts.items():
+            mine[k] = mine.get(k, 0) + v
+    return attrcounts
+
+def CountWorldFiles(tasks, num_threads=1):
+    """Generator over (fpath, attrcounts) for each world graph file of a task list, chunks of the same file are merged before the file is yielded"""
+    pool = Pool(min(num_threads, len(tasks))) if num_threads is not None and num_threads > 1 and len(tasks) > 1 else None
+    try:
+        results = pool.imap(CountWorldTask, tasks) if pool is not None else map(CountWorldTask, tasks)
+        current = None
+        counts = None
+        for task, result in zip(tasks, results):
+            if task[0] != current:
+                if current is not None:
+                    yield current, counts
+                current = task[0]
+                counts = result
+            else:
+                MergeCounts(counts, result)
+        if current is not None:
+            yield current, counts
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def CountWorld(tasks, attrcounts=None, num_threads=1):
+    """Function to run counting tasks, in a process pool when num_threads is above one, and merge the results in task order"""
+    attrcounts = {} if attrcounts is None else attrcounts
+    if num_threads is None or num_threads <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            CountWorldTask(task, attrcounts)
+        return attrcounts
+    for fpath, counts in CountWorldFiles(tasks, num_threads):
+        MergeCounts(attrcounts, counts)
+    return attrcounts
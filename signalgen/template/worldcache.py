@@ -0,0 +1,378 @@
+import os
+import json
+import mmap
+import uuid
+import shutil
+import hashlib
+import datetime
+import numpy as np
+
+from signalgen.template.world import WorldFiles, WorldTasks, CountWorldFiles
+
+WORLD_CACHE_VERSION = 1
+
+def EncodeValue(value):
+    """Function to encode an attribute value as tagged utf-8 bytes for the cache value dictionary"""
+    if type(value) is float:
+        return ('f' + repr(value)).encode('utf-8')
+    elif type(value) is datetime.datetime:
+        return ('T' + value.isoformat()).encode('utf-8')
+    elif type(value) is datetime.date:
+        return ('D' + value.isoformat()).encode('utf-8')
+    elif type(value) is datetime.time:
+        return ('H' + value.isoformat()).encode('utf-8')
+    return ('s' + str(value)).encode('utf-8')
+
+def DecodeValue(data):
+    """Function to decode a value written by EncodeValue"""
+    text = data.decode('utf-8')
+    tag = text[:1]
+    if tag == 'f':
+        return float(text[1:])
+    elif tag == 'T':
+        return datetime.datetime.fromisoformat(text[1:])
+    elif tag == 'D':
+        return datetime.date.fromisoformat(text[1:])
+    elif tag == 'H':
+        return datetime.time.fromisoformat(text[1:])
+    return text[1:]
+
+def FileHash(fpath, blocksize=1024*1024):
+    """Function to compute the sha1 hash of a file"""
+    h = hashlib.sha1()
+    with open(fpath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def SourceManifest(wrldir, exts=['nt', 'gz']):
+    """Function to record the size, mtime and hash of every world graph file in a directory"""
+    sources = {}
+    for fpath in sorted(WorldFiles(wrldir, exts)):
+        st = os.stat(fpath)
+        sources[os.path.basename(fpath)] = {"size": st.st_size, "mtime": st.st_mtime, "sha1": FileHash(fpath)}
+    return sources
+
+def DiffSources(sources, wrldir, exts=['nt', 'gz']):
+    """Function to compare a source manifest against a world graph directory, returns the changed, added and removed file names; files are only hashed when their size matches but their mtime does not"""
+    changed = []
+    added = []
+    current = set()
+    for fpath in sorted(WorldFiles(wrldir, exts)):
+        name = os.path.basename(fpath)
+        current.add(name)
+        if name not in sources:
+            added += [name]
+            continue
+        st = os.stat(fpath)
+        if st.st_size != sources[name]["size"]:
+            changed += [name]
+        elif st.st_mtime != sources[name]["mtime"] and FileHash(fpath) != sources[name]["sha1"]:
+            changed += [name]
+    removed = sorted(i for i in sources if i not in current)
+    return changed, added, removed
+
+def ReadManifest(path):
+    """Function to read the manifest of a world cache, returns None if path is not a world cache of the current version"""
+    mpath = os.path.join(path, 'manifest.json')
+    if not os.path.isfile(mpath):
+        return None
+    with open(mpath) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != WORLD_CACHE_VERSION:
+        return None
+    return manifest
+
+def WorldCachePath(path):
+    """Function that returns where the world cache for a configured cache path lives, beside the path when it holds a legacy pickled cache so the pickle is never replaced"""
+    return path + '.d' if os.path.isfile(path) else path
+
+def IsWorldCacheDir(path):
+    """Function to check that a directory holds a world cache of any version, the only kind of directory a world cache may replace"""
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return "version" in json.load(f)
+    except (OSError, ValueError, TypeError):
+        return False
+
+def IsWorldCacheFresh(path, wrldir=None):
+    """Function to check that a world cache exists, has the current version and still matches the files of the world graph directory"""
+    manifest = ReadManifest(path)
+    if manifest is None:
+        return False
+    if not wrldir or not os.path.isdir(wrldir):
+        return True
+    changed, added, removed = DiffSources(manifest["sources"], wrldir, manifest["exts"])
+    return len(changed) + len(added) + len(removed) == 0
+
+class WorldCacheBuilder:
+    """Class that accumulates attribute counts in the dictionary encoded id space of a world cache and writes the cache; counts of each source file are kept as a delta so the file can later be subtracted again"""
+    def __init__(self, path=None):
+        self.path = path
+        self.manifest = ReadManifest(path) if path != None else None
+        self.values = {}
+        self.attributes = {}
+        self.keys = []
+        self.counts = []
+        self.deltas = {}
+        if self.manifest != None:
+            offsets = np.load(os.path.join(path, 'values.npy'))
+            with open(os.path.join(path, 'values.bin'), 'rb') as f:
+                valuebin = f.read()
+            for i in range(len(offsets) - 1):
+                self.values[valuebin[offsets[i]:offsets[i + 1]]] = i
+            self.attributes = {k: i for i, k in enumerate(self.manifest["attributes"])}
+            attroffsets = np.load(os.path.join(path, 'attrs.npy'))
+            aids = np.repeat(np.arange(len(attroffsets) - 1, dtype=np.int64), np.diff(attroffsets))
+            self.keys += [(aids << 32) | np.load(os.path.join(path, 'ids.npy'))]
+            self.counts += [np.load(os.path.join(path, 'counts.npy'))]
+            self.deltas = {k: None for k in self.manifest.get("deltas", {}).keys()}
+
+    def Encode(self, attrcounts):
+        """Function to encode attribute counts as arrays of combined attribute and value ids and their counts"""
+        keys = []
+        counts = []
+        for attr, attrcount in attrcounts.items():
+            if not isinstance(attrcount, dict):
+                continue
+            aid = self.attributes.get(str(attr))
+            if aid is None:
+                aid = self.attributes[str(attr)] = len(self.attributes)
+            for k, v in attrcount.items():
+                key = EncodeValue(k)
+                vid = self.values.get(key)
+                if vid is None:
+                    vid = self.values[key] = len(self.values)
+                keys += [(aid << 32) | vid]
+                counts += [v]
+        return np.array(keys, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+    def AddCounts(self, attrcounts):
+        """Function to add attribute counts that do not belong to a tracked source file"""
+        keys, counts = self.Encode(attrcounts)
+        self.keys += [keys]
+        self.counts += [counts]
+        return self
+
+    def AddFile(self, name, attrcounts):
+        """Function to add the attribute counts of a source file and remember them as that file's delta"""
+        keys, counts = self.Encode(attrcounts)
+        self.keys += [keys]
+        self.counts += [counts]
+        self.deltas[name] = (keys, counts)
+        return self
+
+    def Delta(self, name):
+        """Function to return the stored delta of a source file"""
+        if self.deltas[name] is None:
+            with np.load(os.path.join(self.path, self.manifest["deltas"][name])) as d:
+                self.deltas[name] = (d['keys'], d['counts'])
+        return self.deltas[name]
+
+    def RemoveFile(self, name):
+        """Function to subtract the counts a source file contributed"""
+        keys, counts = self.Delta(name)
+        self.keys += [keys]
+        self.counts += [-counts]
+        del self.deltas[name]
+        return self
+
+    def Write(self, path, wrldir=None, exts=['nt', 'gz'], sources=None):
+        """Function to write the accumulated counts, value dictionary and source deltas to a world cache directory, an existing world cache is moved aside until the new one is in place and anything else at the path is left alone with an error"""
+        keys = np.concatenate(self.keys) if len(self.keys) > 0 else np.zeros(0, dtype=np.int64)
+        counts = np.concatenate(self.counts) if len(self.counts) > 0 else np.zeros(0, dtype=np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(totals, inverse, counts)
+        keys = keys[totals > 0]
+        totals = totals[totals > 0]
+        attroffsets = np.searchsorted(keys >> 32, np.arange(len(self.attributes) + 1, dtype=np.int64))
+        if sources is None:
+            sources = SourceManifest(wrldir, exts) if wrldir else {}
+        if os.path.lexists(path) and not (os.path.isdir(path) and IsWorldCacheDir(path)):
+            raise FileExistsError(path + ' exists and is not a world cache, it is not replaced')
+
+        tmppath = path + '.tmp'
+        if os.path.isdir(tmppath):
+            shutil.rmtree(tmppath)
+        os.makedirs(os.path.join(tmppath, 'deltas'))
+        valoffsets = np.zeros(len(self.values) + 1, dtype=np.int64)
+        with open(os.path.join(tmppath, 'values.bin'), 'wb') as f:
+            for i, key in enumerate(self.values):
+                f.write(key)
+                valoffsets[i + 1] = valoffsets[i] + len(key)
+        np.save(os.path.join(tmppath, 'values.npy'), valoffsets)
+        np.save(os.path.join(tmppath, 'attrs.npy'), attroffsets.astype(np.int64))
+        np.save(os.path.join(tmppath, 'ids.npy'), keys & 0xffffffff)
+        np.save(os.path.join(tmppath, 'counts.npy'), totals)
+        deltas = {}
+        for name, delta in self.deltas.items():
+            deltas[name] = os.path.join('deltas', hashlib.sha1(name.encode('utf-8')).hexdigest() + '.npz')
+            if delta is None:
+                try:
+                    os.link(os.path.join(self.path, self.manifest["deltas"][name]), os.path.join(tmppath, deltas[name]))
+                except OSError:
+                    shutil.copyfile(os.path.join(self.path, self.manifest["deltas"][name]), os.path.join(tmppath, deltas[name]))
+            else:
+                np.savez(os.path.join(tmppath, deltas[name]), keys=delta[0], counts=delta[1])
+        manifest = {
+            "version": WORLD_CACHE_VERSION,
+            "build": uuid.uuid4().hex,
+            "wrldir": os.path.abspath(wrldir) if wrldir else None,
+            "exts": exts,
+            "sources": sources,
+            "deltas": deltas,
+            "attributes": list(self.attributes.keys())
+        }
+        with open(os.path.join(tmppath, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        if os.path.isdir(path):
+            oldpath = path + '.old'
+            if os.path.isdir(oldpath):
+                shutil.rmtree(oldpath)
+            os.replace(path, oldpath)
+            os.replace(tmppath, path)
+            shutil.rmtree(oldpath)
+        else:
+            os.replace(tmppath, path)
+        return WorldCache(path)
+
+def WriteWorldCache(path, attrcounts, wrldir=None, exts=['nt', 'gz'], sources=None):
+    """Function to write attribute counts to a world cache directory; values are dictionary encoded and each attribute's value ids and counts are stored as contiguous numpy arrays"""
+    return WorldCacheBuilder().AddCounts(attrcounts).Write(path, wrldir, exts, sources)
+
+def BuildWorldCache(path, wrldir, exts=['nt', 'gz'], num_threads=1, chunksize=64*1024*1024):
+    """Function to count a world graph directory file by file and write a world cache that keeps a delta per source file"""
+    builder = WorldCacheBuilder()
+    for fpath, counts in CountWorldFiles(WorldTasks(wrldir, exts, True, chunksize), num_threads):
+        builder.AddFile(os.path.basename(fpath), counts)
+    return builder.Write(path, wrldir, exts)
+
+def UpdateWorldCache(path, wrldir, exts=['nt', 'gz'], num_threads=1, chunksize=64*1024*1024):
+    """Function to bring a world cache up to date with its world graph directory; changed and added files are recounted and merged in and removed files have their deltas subtracted, the cache is rebuilt from scratch when it has no deltas to work from"""
+    manifest = ReadManifest(path)
+    if manifest is None or manifest["exts"] != exts or sorted(manifest.get("deltas", {}).keys()) != sorted(manifest["sources"].keys()):
+        return BuildWorldCache(path, wrldir, exts, num_threads, chunksize)
+    changed, added, removed = DiffSources(manifest["sources"], wrldir, exts)
+    if len(changed) + len(added) + len(removed) == 0:
+        mtimes = {os.path.basename(i): os.stat(i).st_mtime for i in WorldFiles(wrldir, exts)}
+        if any(manifest["sources"][k]["mtime"] != v for k, v in mtimes.items()):
+            for k, v in mtimes.items():
+                manifest["sources"][k]["mtime"] = v
+            with open(os.path.join(path, 'manifest.json.tmp'), 'w') as f:
+                json.dump(manifest, f)
+            os.replace(os.path.join(path, 'manifest.json.tmp'), os.path.join(path, 'manifest.json'))
+        return WorldCache(path)
+    builder = WorldCacheBuilder(path)
+    for name in changed + removed:
+        builder.RemoveFile(name)
+    tasks = [i for i in WorldTasks(wrldir, exts, True, chunksize) if os.path.basename(i[0]) in changed + added]
+    for fpath, counts in CountWorldFiles(tasks, num_threads):
+        builder.AddFile(os.path.basename(fpath), counts)
+    sources = {}
+    for fpath in sorted(WorldFiles(wrldir, exts)):
+        name = os.path.basename(fpath)
+        st = os.stat(fpath)
+        if name in changed or name in added:
+            sources[name] = {"size": st.st_size, "mtime": st.st_mtime, "sha1": FileHash(fpath)}
+        else:
+            sources[name] = dict(manifest["sources"][name], mtime=st.st_mtime)
+    return builder.Write(path, wrldir, exts, sources)
+
+class WorldCache(dict):
+    """Class that inherits from the dictionary class and mimics the structure of the attribute count dictionary; attribute counts are decoded from the memory mapped cache the first time an attribute is accessed"""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.manifest = ReadManifest(path)
+        if self.manifest is None:
+            raise Exception("World cache not found or of an unsupported version: " + path)
+        self.attroffsets = np.load(os.path.join(path, 'attrs.npy'))
+        self.attributes = {k: i for i, k in enumerate(self.manifest["attributes"]) if self.attroffsets[i + 1] > self.attroffsets[i]}
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        self.counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r')
+        self.valoffsets = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        self.valuebin = b''
+        if os.path.getsize(os.path.join(path, 'values.bin')) > 0:
+            with open(os.path.join(path, 'values.bin'), 'rb') as f:
+                self.valuebin = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __reduce__(self):
+        return (WorldCache, (self.path,))
+
+    def Value(self, vid):
+        """Function to decode a single value of the cache value dictionary"""
+        return DecodeValue(self.valuebin[int(self.valoffsets[vid]):int(self.valoffsets[vid + 1])])
+
+    def LoadAttribute(self, attr):
+        """Function to decode the value counts of one attribute from the cache"""
+        i = self.attributes[attr]
+        start, end = int(self.attroffsets[i]), int(self.attroffsets[i + 1])
+        ids = self.ids[start:end].tolist()
+        counts = self.counts[start:end].tolist()
+        attrcount = {self.Value(vid): c for vid, c in zip(ids, counts)}
+        super().__setitem__(attr, attrcount)
+        return attrcount
+
+    def TokenPath(self, attr):
+        """Function to return the path of the stored token index of an attribute"""
+        return os.path.join(self.path, 'tokens', hashlib.sha1(attr.encode('utf-8')).hexdigest() + '.npz')
+
+    def ReadTokens(self, attr):
+        """Function to read the stored token index arrays of an attribute, returns None if there are none for this build of the cache"""
+        tpath = self.TokenPath(attr)
+        if not os.path.isfile(tpath):
+            return None
+        with np.load(tpath) as d:
+            if str(d['build']) != self.manifest["build"]:
+                return None
+            return {k: d[k] for k in d.files if k != 'build'}
+
+    def WriteTokens(self, attr, arrays):
+        """Function to store the token index arrays of an attribute next to its counts, a cache that can not be written to is left as is"""
+        tpath = self.TokenPath(attr)
+        try:
+            os.makedirs(os.path.dirname(tpath), exist_ok=True)
+            with open(tpath + '.' + str(os.getpid()) + '.tmp', 'wb') as f:
+                np.savez(f, build=np.array(self.manifest["build"]), **arrays)
+            os.replace(tpath + '.' + str(os.getpid()) + '.tmp', tpath)
+        except OSError:
+            pass
+        return self
+
+    def __getitem__(self, key):
+        if not super().__contains__(key):
+            if self.attributes.get(key) is None:
+                raise KeyError(key)
+            return self.LoadAttribute(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, item):
+        if key not in self.attributes:
+            self.attributes[key] = None
+        super().__setitem__(key, item)
+
+    def __contains__(self, key):
+        return key in self.attributes
+
+    def __iter__(self):
+        return iter(self.attributes)
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def __repr__(self):
+        return 'WorldCache(' + repr(self.path) + ')'
+
+    def get(self, key, default=None):
+        return self[key] if key in self.attributes else default
+
+    def keys(self):
+        return self.attributes.keys()
+
+    def values(self):
+        return [self[k] for k in self.attributes]
+
+    def items(self):
+        return [(k, self[k]) for k in self.attributes]
@@ -0,0 +1,84 @@
+import json
+import time
+import threading
+import http.server
+
+RDFNS = 'http://schema.localhost/'
+#[attribute, schema class, range]
+ATTRIBUTES = [
+    ['eventName', 'Event', 'Text'],
+    ['eventDescription', 'Event', 'Text'],
+    ['eventCount', 'Event', 'Integer'],
+    ['eventScore', 'Event', 'Number'],
+    ['startDate', 'Event', 'Date'],
+    ['eventGeo', 'Event', 'GeoShape'],
+    ['relatedEvent', 'Event', 'Event'],
+    ['personIdentifierSurName', 'PersonIdentifier', 'Text'],
+    ['personIdentifierGivenName', 'PersonIdentifier', 'Text'],
+    ['locationCity', 'AddressLocation', 'Text'],
+    ['locationStreet', 'AddressLocation', 'Text'],
+    ['locationGeoPoint', 'AddressLocation', 'GeoShape'],
+]
+
+def WriteSchema(fpath, attributes=ATTRIBUTES):
+    """Function to write a JSON-LD schema declaring the classes and attributes"""
+    graph = [{'@id': RDFNS + i, '@type': 'rdfs:Class'} for i in dict.fromkeys([j[1] for j in attributes])]
+    graph += [{'@id': RDFNS + i[0], '@type': 'rdf:Property', RDFNS + 'domainIncludes': {'@id': RDFNS + i[1]}, RDFNS + 'rangeIncludes': {'@id': RDFNS + i[2]}} for i in attributes]
+    with open(fpath, 'w') as f:
+        json.dump({'@context': {'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#', 'rdfs': 'http://www.w3.org/2000/01/rdf-schema#'}, '@graph': graph}, f, indent=1)
+    return fpath
+
+class StatsStandIn:
+    """Class that serves the propertyCounts route of the stats endpoint from attribute counts on a local port, the first failures requests are answered with a 503 and the properties of every served batch are recorded"""
+    def __init__(self, attrcounts, latency=0.0, failures=0):
+        self.attrcounts = attrcounts
+        self.latency = latency
+        self.failures = failures
+        self.requests = 0
+        self.batches = []
+        self.server = None
+        self.thread = None
+
+    def Handler(self):
+        """Function that returns the request handler class bound to this stand-in"""
+        standin = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                standin.requests += 1
+                time.sleep(standin.latency)
+                if standin.failures > 0:
+                    standin.failures -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                standin.batches += [[i['propertyName'] for i in body['nodeProperties']]]
+                buckets = []
+                for i in body['nodeProperties']:
+                    counts = standin.attrcounts.get(i['propertyName'], {})
+                    buckets += [{'propertyName': i['propertyName'], 'buckets': [{'key': k, 'doc_count': v} for k,v in sorted(counts.items(), key=lambda x: -x[1])]}]
+                data = json.dumps({'propertyBuckets': buckets}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def log_message(self, *args):
+                return
+        return Handler
+
+    def Start(self):
+        """Function to start serving on a free local port, returns the base url of the stand-in"""
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self.Handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/'
+
+    def Stop(self):
+        """Function to stop serving"""
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        return self
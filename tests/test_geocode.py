@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+
+from signalgen.template.geocode import AddressFeature, CachedGeocoder, GazetteerGeocoder, UnitVectors
+
+def Gazetteer(lats, lons):
+    """Function that returns a gazetteer of numbered entries at the given points"""
+    return [AddressFeature(lat, lon, {'display_name': str(i)}) for i, (lat, lon) in enumerate(zip(lats, lons))]
+
+class GazetteerGeocoderTest(unittest.TestCase):
+    """Checks the grid search of the gazetteer geocoder against a brute force nearest entry"""
+    def Check(self, geocoder, lats, lons):
+        """Function that asserts every query gets an entry as close as the brute force nearest one"""
+        for lat, lon in zip(lats, lons):
+            d = ((geocoder.xyz - UnitVectors(lat, lon)) ** 2).sum(axis=1)
+            self.assertEqual(d[geocoder.Nearest(lat, lon)], d.min(), (lat, lon))
+
+    def test_nearest_across_the_antimeridian(self):
+        for seed in range(4):
+            rng = np.random.default_rng(seed)
+            for n in [50, 300, 2000]:
+                geocoder = GazetteerGeocoder(Gazetteer(rng.uniform(40, 41, n), rng.uniform(179.5, 180, n)))
+                self.assertAlmostEqual(geocoder.cellsize * geocoder.ncols, 360)
+                self.Check(geocoder, rng.uniform(40, 41, 500), rng.uniform(-180, -179, 500))
+
+    def test_nearest_worldwide(self):
+        rng = np.random.default_rng(0)
+        geocoder = GazetteerGeocoder(Gazetteer(np.degrees(np.arcsin(rng.uniform(-1, 1, 2000))), rng.uniform(-180, 180, 2000)))
+        self.Check(geocoder, np.degrees(np.arcsin(rng.uniform(-1, 1, 1000))), rng.uniform(-180, 180, 1000))
+        self.Check(geocoder, [89.99, -89.99, 0.0], [0.0, 179.99, -180.0])
+
+    def test_reverse_and_cache(self):
+        geocoder = CachedGeocoder(GazetteerGeocoder(Gazetteer([46.2, 47.0], [-119.1, -120.0])))
+        self.assertEqual(geocoder.Reverse(46.21, -119.09)['properties']['display_name'], '0')
+        self.assertEqual(geocoder.Reverse(46.21, -119.09)['properties']['display_name'], '0')
+        self.assertEqual((geocoder.hits, geocoder.misses), (1, 1))
+        self.assertEqual(GazetteerGeocoder([]).Reverse(0, 0)['properties']['error'], 'Unable to geocode')
+
+if __name__ == '__main__':
+    unittest.main()
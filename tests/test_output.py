@@ -0,0 +1,90 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from signalgen.template.output import GraphName, ShardedWriter
+
+def Triples(signal, n):
+    """Function that returns n distinct triples of a signal"""
+    return [('<http://schema.localhost/' + signal + '/' + str(i) + '>', '<http://schema.localhost/name>', '"' + signal + ' ' + str(i) + '"') for i in range(n)]
+
+class ShardedWriterTest(unittest.TestCase):
+    """Checks that every manifest entry reads back its own signal from its shard and that shards are rotated at their limits"""
+    SIZES = [3, 4, 2, 7, 1, 5, 5, 2]
+
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp(prefix='signalgen-output-')
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def Write(self, **kwargs):
+        """Function that writes the test signals and returns the manifest entries"""
+        with ShardedWriter(self.outdir, 'signals', **kwargs) as writer:
+            for k, n in enumerate(self.SIZES):
+                writer.WriteSignal('s' + str(k), 'template|0.5|' + str(k), Triples('s' + str(k), n), 'template|0.5|' + str(k) + '|partial' if k == 0 else None)
+        with open(os.path.join(self.outdir, 'signals.manifest.jsonl')) as f:
+            return [json.loads(l) for l in f]
+
+    def Check(self, entries, quads, compress):
+        """Function that re-reads every entry on its own from its shard and compares it with the triples written"""
+        self.assertEqual([i['signal'] for i in entries], ['s' + str(k) for k in range(len(self.SIZES))])
+        for k, entry in enumerate(entries):
+            with open(os.path.join(self.outdir, entry['shard']), 'rb') as f:
+                f.seek(entry['offset'])
+                data = f.read(entry['length'])
+            text = (gzip.decompress(data) if compress else data).decode('utf-8')
+            lines = text.splitlines()
+            self.assertEqual(len(lines), self.SIZES[k])
+            self.assertEqual(entry['triples'], self.SIZES[k])
+            graph = GraphName(entry['originSource'] + ('|partial' if k == 0 else ''))
+            for line, triple in zip(lines, Triples(entry['signal'], self.SIZES[k])):
+                self.assertTrue(line.startswith(' '.join(triple)))
+                self.assertEqual(line.endswith(' ' + graph + ' .'), quads)
+            if quads:
+                self.assertEqual('<' + entry['graph'] + '>', graph)
+
+    def Shards(self, entries):
+        """Function that groups the manifest entries by shard in order"""
+        shards = {}
+        for i in entries:
+            shards.setdefault(i['shard'], []).append(i)
+        return list(shards.values())
+
+    def test_rotates_by_triples(self):
+        for quads, compress in [(True, False), (True, True), (False, False), (False, True)]:
+            entries = self.Write(quads=quads, compress=compress, maxbytes=None, maxtriples=6)
+            self.Check(entries, quads, compress)
+            shards = self.Shards(entries)
+            self.assertGreater(len(shards), 1)
+            for shard in shards:
+                self.assertLess(sum([i['triples'] for i in shard[:-1]]), 6)
+            for shard in shards[:-1]:
+                self.assertGreaterEqual(sum([i['triples'] for i in shard]), 6)
+            shutil.rmtree(self.outdir)
+            os.makedirs(self.outdir)
+
+    def test_rotates_by_bytes(self):
+        entries = self.Write(quads=True, compress=True, maxbytes=200)
+        self.Check(entries, True, True)
+        shards = self.Shards(entries)
+        self.assertGreater(len(shards), 1)
+        for shard in shards:
+            self.assertLess(shard[-1]['offset'], 200)
+            self.assertEqual(os.path.getsize(os.path.join(self.outdir, shard[-1]['shard'])), shard[-1]['offset'] + shard[-1]['length'])
+
+    def test_never_overwrites(self):
+        self.Write(quads=True)
+        with self.assertRaises(FileExistsError):
+            ShardedWriter(self.outdir, 'signals')
+        os.remove(os.path.join(self.outdir, 'signals.manifest.jsonl'))
+        writer = ShardedWriter(self.outdir, 'signals', quads=True)
+        with self.assertRaises(FileExistsError):
+            writer.WriteSignal('s', 'template', Triples('s', 1))
+        writer.Close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import requests
+
+from signalgen.template.stats import Stats
+from tests.standin import ATTRIBUTES, StatsStandIn, WriteSchema
+
+PROPS = [i[0] for i in ATTRIBUTES]
+
+class StatsTest(unittest.TestCase):
+    """Checks the batched stats client, its retries and its disk cache against a local stand-in of the stats endpoint"""
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='signalgen-stats-')
+        self.schema = WriteSchema(os.path.join(self.workdir, 'schema.jsonld'))
+        self.cachedir = os.path.join(self.workdir, 'cache')
+        self.attrcounts = {k: {k + '-' + str(j): j + 1 for j in range(i + 1)} for i,k in enumerate(PROPS[:-1])}
+        self.standin = None
+        self.qapi = None
+
+    def tearDown(self):
+        if self.standin != None:
+            self.standin.Stop()
+        shutil.rmtree(self.workdir)
+
+    def Client(self, failures=0, **kwargs):
+        """Function that returns a stats client pointed at the stand-in, starting it on first use, the cache is keyed by the stand-in's url so every client of a test shares it"""
+        if self.standin == None:
+            self.standin = StatsStandIn(self.attrcounts)
+            self.qapi = self.standin.Start()
+        self.standin.failures = failures
+        return Stats(self.schema, self.qapi, **kwargs)
+
+    def test_batches_and_matches_buckets_by_property(self):
+        stats = self.Client(batchsize=5).Prefetch(PROPS)
+        self.assertEqual(self.standin.batches, [PROPS[0:5], PROPS[5:10], PROPS[10:12]])
+        for k in PROPS[:-1]:
+            self.assertEqual(stats[k], self.attrcounts[k])
+        self.assertEqual(stats[PROPS[-1]], {})
+        self.assertEqual(self.standin.requests, 3)
+
+    def test_getitem_fetches_once(self):
+        stats = self.Client()
+        self.assertEqual(stats[PROPS[0]], self.attrcounts[PROPS[0]])
+        self.assertEqual(stats[PROPS[0]], self.attrcounts[PROPS[0]])
+        self.assertEqual(self.standin.requests, 1)
+        with self.assertRaises(KeyError):
+            stats['notAnAttribute']
+
+    def test_cache_hits_and_expiry(self):
+        self.Client(cachedir=self.cachedir, ttl=3600).Prefetch(PROPS)
+        cached = self.Client(cachedir=self.cachedir, ttl=3600).Prefetch(PROPS)
+        self.assertEqual(self.standin.requests, 1)
+        self.assertEqual(cached[PROPS[0]], self.attrcounts[PROPS[0]])
+        self.assertEqual(cached[PROPS[-1]], {})
+        for i in os.listdir(self.cachedir):
+            with open(os.path.join(self.cachedir, i)) as f:
+                entry = json.load(f)
+            entry['time'] -= 7200
+            with open(os.path.join(self.cachedir, i), 'w') as f:
+                json.dump(entry, f)
+        expired = self.Client(cachedir=self.cachedir, ttl=3600).Prefetch(PROPS)
+        self.assertEqual(self.standin.requests, 2)
+        self.assertEqual(expired[PROPS[0]], self.attrcounts[PROPS[0]])
+
+    def test_retries_server_errors(self):
+        stats = self.Client(failures=1, retries=2).Prefetch(PROPS[:3])
+        self.assertEqual(self.standin.requests, 2)
+        self.assertEqual(stats[PROPS[2]], self.attrcounts[PROPS[2]])
+
+    def test_failed_batch_is_not_kept(self):
+        stats = self.Client(failures=2, retries=1, cachedir=self.cachedir).Prefetch(PROPS[:3])
+        self.assertEqual(self.standin.requests, 2)
+        self.assertEqual(os.listdir(self.cachedir), [])
+        self.assertEqual(len(stats), 0)
+        self.assertEqual(stats[PROPS[0]], self.attrcounts[PROPS[0]])
+        self.assertEqual(self.standin.requests, 3)
+
+    def test_getitem_raises_when_the_endpoint_is_down(self):
+        stats = self.Client(failures=100, retries=1)
+        with self.assertRaises(requests.RequestException):
+            stats[PROPS[0]]
+        self.assertEqual(len(stats), 0)
+
+if __name__ == '__main__':
+    unittest.main()
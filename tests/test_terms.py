@@ -0,0 +1,43 @@
+import datetime
+import unittest
+
+from signalgen.template.terms import TermCache
+
+class TermCacheTest(unittest.TestCase):
+    """Checks that cached terms are the ones their values render to"""
+    def Cache(self, renders):
+        """Function that returns a term cache whose datums render to repr(value), counting the renders"""
+        cache = TermCache(None)
+        def Lookup(key, render, lookup=cache.Lookup):
+            return lookup(key, lambda: renders.append(key) or repr(key[-2]))
+        cache.Lookup = Lookup
+        return cache
+
+    def test_equal_values_that_render_differently(self):
+        renders = []
+        cache = self.Cache(renders)
+        utc = datetime.datetime(2020, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        shifted = utc.astimezone(datetime.timezone(datetime.timedelta(hours=2)))
+        self.assertEqual(utc, shifted)
+        self.assertNotEqual(cache.Datum('startDate', utc), cache.Datum('startDate', shifted))
+        self.assertNotEqual(cache.Datum('eventScore', 0.0), cache.Datum('eventScore', -0.0))
+        self.assertNotEqual(cache.Datum('eventScore', 1), cache.Datum('eventScore', 1.0))
+        self.assertEqual(len(renders), 6)
+
+    def test_falsy_terms_are_cached(self):
+        cache = TermCache(None)
+        calls = []
+        for i in range(3):
+            self.assertEqual(cache.Lookup(('iri', 'x'), lambda: calls.append(1) or ''), '')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_evicts_least_recently_used(self):
+        cache = TermCache(None, 2)
+        for k in ['a', 'b', 'a', 'c']:
+            cache.Lookup(k, lambda: k.upper())
+        self.assertEqual(list(cache.terms.keys()), ['a', 'c'])
+        self.assertEqual(cache.evictions, 1)
+
+if __name__ == '__main__':
+    unittest.main()
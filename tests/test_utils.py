@@ -0,0 +1,78 @@
+import random
+import unittest
+import numpy as np
+
+from signalgen.template.utils import AcceptsRng, SolveDifferenceConstraints
+
+def Satisfied(edges, offsets):
+    """Function to check that offsets meet every edge [thing1, thing2, (minValue, maxValue)]"""
+    return all([i[2][0] <= offsets[i[0]] - offsets[i[1]] <= i[2][1] for i in edges])
+
+class AcceptsRngTest(unittest.TestCase):
+    """Checks which attribute generators are handed the random generator"""
+    def test_four_argument_generators(self):
+        self.assertFalse(AcceptsRng(lambda attr, cond, condval, difficulty=0.5: None))
+        self.assertFalse(AcceptsRng(lambda attr, cond, condval, difficulty, **kwargs: None))
+        self.assertFalse(AcceptsRng(lambda attr, cond, condval, difficulty=0.5, *, rng=None: None))
+
+    def test_generators_that_take_rng(self):
+        self.assertTrue(AcceptsRng(lambda attr, cond, condval, difficulty=0.5, rng=None: None))
+        self.assertTrue(AcceptsRng(lambda attr, cond, condval, difficulty, seed: None))
+        self.assertTrue(AcceptsRng(lambda *args: None))
+
+class SolveDifferenceConstraintsTest(unittest.TestCase):
+    """Checks the difference constraint solver on feasible, fixed and infeasible graphs"""
+    def test_random_graphs_are_satisfied(self):
+        rng = np.random.default_rng(0)
+        for n in range(2, 30):
+            truth = {k: int(v) for k,v in enumerate(rng.integers(-50, 50, n))}
+            edges = []
+            for a,b in rng.integers(0, n, (2 * n, 2)):
+                if a != b:
+                    d = truth[a] - truth[b]
+                    edges += [[a, b, (d - int(rng.integers(0, 5)), d + int(rng.integers(0, 5)))]]
+            if len(edges) == 0:
+                continue
+            offsets = SolveDifferenceConstraints(edges, rng=np.random.default_rng(n))
+            self.assertTrue(Satisfied(edges, offsets))
+            self.assertTrue(all([type(v) is int for v in offsets.values()]))
+            self.assertEqual(offsets, SolveDifferenceConstraints(edges, rng=np.random.default_rng(n)))
+
+    def test_components_start_at_zero(self):
+        offsets = SolveDifferenceConstraints([['a', 'b', (1, 5)], ['c', 'd', (-3, -1)]], rng=np.random.default_rng(0))
+        self.assertEqual((offsets['a'], offsets['c']), (0, 0))
+        self.assertTrue(1 <= offsets['a'] - offsets['b'] <= 5)
+
+    def test_fixed_nodes_keep_their_values(self):
+        edges = [['a', 'b', (1, 5)], ['b', 'c', (2, 30)], ['a', 'c', (3, 10)]]
+        offsets = SolveDifferenceConstraints(edges, {'c': 100}, np.random.default_rng(0))
+        self.assertEqual(offsets['c'], 100)
+        self.assertTrue(Satisfied(edges, offsets))
+        offsets = SolveDifferenceConstraints(edges, {'a': 7, 'c': 0}, np.random.default_rng(0))
+        self.assertEqual((offsets['a'], offsets['c']), (7, 0))
+        self.assertTrue(Satisfied(edges, offsets))
+
+    def test_fixed_nodes_that_break_constraints(self):
+        with self.assertRaises(ValueError):
+            SolveDifferenceConstraints([['a', 'b', (1, 5)]], {'a': 0, 'b': 0})
+        with self.assertRaises(ValueError):
+            SolveDifferenceConstraints([['a', 'b', (0, 1)], ['b', 'c', (0, 0)]], {'a': 0.5, 'b': 0.5})
+
+    def test_contradictory_cycle(self):
+        with self.assertRaises(ValueError):
+            SolveDifferenceConstraints([['a', 'b', (1, 2)], ['b', 'c', (1, 2)], ['c', 'a', (1, 2)]])
+
+    def test_interval_without_integers(self):
+        with self.assertRaises(ValueError):
+            SolveDifferenceConstraints([['a', 'b', (0.2, 0.6)]])
+        self.assertEqual(SolveDifferenceConstraints([['a', 'b', (0.2, 1.6)]]), {'a': 0, 'b': -1})
+
+    def test_global_random_state(self):
+        edges = [['a', 'b', (1, 50)], ['b', 'c', (2, 30)]]
+        random.seed(3)
+        first = SolveDifferenceConstraints(edges)
+        random.seed(3)
+        self.assertEqual(first, SolveDifferenceConstraints(edges))
+
+if __name__ == '__main__':
+    unittest.main()
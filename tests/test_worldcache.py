@@ -0,0 +1,45 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from signalgen.template.worldcache import WorldCache, WriteWorldCache
+
+COUNTS = {'eventName': {'a b': 3, 'c': 1}, 'eventScore': {1.5: 2, 7.0: 1}}
+
+class WriteWorldCacheTest(unittest.TestCase):
+    """Checks what WriteWorldCache is allowed to replace at the cache path"""
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='signalgen-worldcache-')
+        self.path = os.path.join(self.workdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_replaces_a_world_cache(self):
+        WriteWorldCache(self.path, {'eventName': {'x': 1}})
+        cache = WriteWorldCache(self.path, COUNTS)
+        self.assertEqual(cache['eventName'], COUNTS['eventName'])
+        self.assertEqual(WorldCache(self.path)['eventScore'], COUNTS['eventScore'])
+        self.assertEqual(sorted(os.listdir(self.workdir)), ['cache'])
+
+    def test_keeps_a_legacy_pickle(self):
+        with open(self.path, 'wb') as f:
+            pickle.dump(COUNTS, f)
+        with self.assertRaises(FileExistsError):
+            WriteWorldCache(self.path, COUNTS)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(pickle.load(f), COUNTS)
+        self.assertEqual(sorted(os.listdir(self.workdir)), ['cache'])
+
+    def test_keeps_an_unrelated_directory(self):
+        os.makedirs(self.path)
+        with open(os.path.join(self.path, 'notes.txt'), 'w') as f:
+            f.write('keep')
+        with self.assertRaises(FileExistsError):
+            WriteWorldCache(self.path, COUNTS)
+        self.assertEqual(os.listdir(self.path), ['notes.txt'])
+
+if __name__ == '__main__':
+    unittest.main()